@@ -0,0 +1,188 @@
+'''
+============================================================
+Index of known cube algorithms, keyed by what they do.
+
+Every algorithm is compiled once into its net sticker permutation
+(see permgroup). Its key is a digest of that permutation made
+canonical modulo whole-cube rotations: the orientation the cube ends
+in is ignored, and so is the side the algorithm is performed from.
+A second key also ignores turns of the U face before and after, to
+look up last-layer cases.
+
+- index = algorithm_index(3, ['algorithms.txt'], cache='algorithms.pickle')
+- index.lookup(perm) = algorithms that have exactly the effect perm.
+- index.solving(perm) = algorithms that solve the last-layer case
+  produced by perm.
+- index.effect("R U R' U'") = the permutation of a move string.
+
+Algorithm files hold one "name: moves" line per algorithm, in the
+notation of notation.py; '#' starts a comment.
+============================================================
+'''
+import os, hashlib, cPickle as pickle
+import numpy as np
+import notation
+from permgroup import move_permutations, state_validator
+
+class CubeMoves(object):
+    '''Sticker permutations of the moves and whole-cube rotations of an NxNxN cube,
+    in the convention of permgroup: state s becomes s[g], and "g then h" is g[h].'''
+    def __init__(self, N):
+        self.N = N
+        self.identity = np.arange(6 * N * N)
+        # rotate_face(face, 1) is the clockwise quarter turn d = 1.
+        self._moves = {}
+        for (face, l), g in move_permutations(N).iteritems():
+            self._moves[(face, l, 1)] = g
+            self._moves[(face, l, 2)] = g[g]
+            self._moves[(face, l, -1)] = g[g[g]]
+        # The 24 rotations, each with a shortest x/y/z word.
+        generators = [(a + b, self.effect(a + b)) for a in 'xyz' for b in ('', "'", '2')]
+        self.rotations = [(self.identity, '')]
+        found = set([self.identity.tostring()])
+        for g, word in self.rotations:
+            for letter, r in generators:
+                h = g[r]
+                if h.tostring() not in found:
+                    found.add(h.tostring())
+                    self.rotations.append((h, (word + ' ' + letter).strip()))
+        self.inverse_rotations = [self.inverse(g) for g, _ in self.rotations]
+        # Reference stickers whose places determine the rotation of a state: the face
+        # centers for odd N, else a corner piece.
+        validator = state_validator(N)
+        self._reference = validator._centers if N % 2 else validator._corners[0]
+        self._rotation_of = dict((g[self._reference].tostring(), k)
+                                 for k, (g, _) in enumerate(self.rotations))
+
+    def inverse(self, g):
+        inv = np.empty_like(g)
+        inv[g] = self.identity
+        return inv
+
+    def sequence(self, moves):
+        '''Returns the permutation of a list of (face, layer, d) moves.'''
+        g = self.identity
+        for move in moves:
+            g = g[self._moves[move]]
+        return g
+
+    def effect(self, text):
+        '''Returns the permutation of a notation string.'''
+        return self.sequence(notation.parse(text, self.N))
+
+    def normalize(self, g):
+        '''Returns g followed by the whole-cube rotation that puts the reference
+        piece back in place, the same for all g that differ by a final rotation.'''
+        k = self._rotation_of[self.inverse(g)[self._reference].tostring()]
+        return g[self.rotations[k][0]]
+
+    def conjugate(self, g, k):
+        '''Returns g performed after rotation k (and undone after it).'''
+        return self.rotations[k][0][g[self.inverse_rotations[k]]]
+
+    def canonical(self, g):
+        '''Returns (digest, k) of the smallest digest of normalize(conjugate(g, k)) over
+        the rotations k.'''
+        return min((hashlib.sha1(self.normalize(self.conjugate(g, k)).astype(np.int32).tostring()).digest(), k)
+                   for k in xrange(len(self.rotations)))
+
+class AlgorithmIndex(object):
+    '''Algorithms of an NxNxN cube, indexed by their effect and their last-layer case.'''
+    def __init__(self, N=3):
+        self.N = N
+        self.algorithms = []
+        self._by_effect = {}
+        self._by_case = {}
+        self.sources = {}
+        self._moves = None
+
+    @property
+    def moves(self):
+        if self._moves is None:
+            self._moves = CubeMoves(self.N)
+        return self._moves
+
+    def __getstate__(self):
+        # The move tables are rebuilt on demand rather than stored.
+        state = self.__dict__.copy()
+        state['_moves'] = None
+        return state
+
+    def effect(self, text):
+        return self.moves.effect(text)
+
+    def _case_key(self, g):
+        # Canonical digest of g up to turns of the U face before and after it.
+        u = self.moves.effect('U')
+        pre = self.moves.identity
+        keys = []
+        for _ in xrange(4):
+            h = pre[g]
+            for _ in xrange(4):
+                keys.append(self.moves.canonical(h)[0])
+                h = h[u]
+            pre = pre[u]
+        return min(keys)
+
+    def add(self, name, text):
+        '''Compiles the algorithm and adds it to the index.'''
+        g = self.moves.effect(text)
+        self.algorithms.append((name, text))
+        self._by_effect.setdefault(self.moves.canonical(g)[0], []).append(len(self.algorithms) - 1)
+        self._by_case.setdefault(self._case_key(self.moves.inverse(g)), []).append(len(self.algorithms) - 1)
+
+    def load(self, file_name):
+        '''Adds the algorithms of a file, skipping those that do not apply to N.'''
+        with open(file_name, 'rb') as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if not line:
+                    continue
+                name, text = [x.strip() for x in line.split(':', 1)]
+                try:
+                    self.add(name, text)
+                except ValueError:
+                    pass
+        self.sources[file_name] = os.path.getmtime(file_name)
+
+    def save(self, file_name):
+        with open(file_name, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def open(file_name):
+        with open(file_name, 'rb') as f:
+            return pickle.load(f)
+
+    def lookup(self, g):
+        '''Returns the (name, moves, setup) of the algorithms whose effect is the
+        permutation g, up to whole-cube rotations: performing the rotation setup, then
+        moves, then undoing setup has the effect of g.'''
+        target = self.moves.normalize(g)
+        result = []
+        for i in self._by_effect.get(self.moves.canonical(g)[0], []):
+            name, text = self.algorithms[i]
+            a = self.moves.effect(text)
+            setup = [word for k, (_, word) in enumerate(self.moves.rotations)
+                     if np.array_equal(self.moves.normalize(self.moves.conjugate(a, k)), target)]
+            result.append((name, text, setup[0]))
+        return result
+
+    def solving(self, g):
+        '''Returns the (name, moves) of the algorithms that solve the last-layer case
+        reached by the permutation g, up to U turns before and after them.'''
+        return [self.algorithms[i] for i in self._by_case.get(self._case_key(g), [])]
+
+def algorithm_index(N, file_names, cache=None):
+    '''Returns the AlgorithmIndex of the algorithm files for an NxNxN cube, loaded from
+    the pickle file cache if it is up to date, else compiled and saved there.'''
+    if cache is not None and os.path.exists(cache):
+        index = AlgorithmIndex.open(cache)
+        if index.N == N and index.sources == dict((f, os.path.getmtime(f)) for f in file_names):
+            return index
+    index = AlgorithmIndex(N)
+    for file_name in file_names:
+        index.load(file_name)
+    if cache is not None:
+        index.save(cache)
+    return index
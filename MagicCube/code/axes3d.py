@@ -1,8 +1,68 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.path import Path
 from projection import Quaternion, project_points
 
 
+def _grow(arr, size):
+    """Return arr, or a copy with at least twice its length if it holds
+    fewer than size rows.  Doubling makes a sequence of appends amortized
+    O(1) per element."""
+    if len(arr) >= size:
+        return arr
+    new = np.empty((max(size, 2 * len(arr)),) + arr.shape[1:], dtype=arr.dtype)
+    new[:len(arr)] = arr
+    return new
+
+
+class GeometryArena(object):
+    """Growable store of polygon vertices
+
+    The vertices of all polygons are kept in one contiguous array, and
+    polygon i occupies rows ``offsets[i]:offsets[i + 1]`` of it.  Both
+    arrays grow by doubling, so adding polygons one at a time costs
+    amortized O(1) per vertex.
+    """
+    def __init__(self, dim=3, capacity=64):
+        self._vertices = np.empty((capacity, dim), dtype=float)
+        self._offsets = np.zeros(capacity + 1, dtype=int)
+        self.num_polys = 0
+        self.num_vertices = 0
+
+    @property
+    def capacity(self):
+        return len(self._vertices)
+
+    @property
+    def vertices(self):
+        """(num_vertices, dim) view of the stored vertices"""
+        return self._vertices[:self.num_vertices]
+
+    @property
+    def offsets(self):
+        """(num_polys + 1,) view of the polygon offset table"""
+        return self._offsets[:self.num_polys + 1]
+
+    def append(self, xyz):
+        """Add one polygon of shape (Npts, dim); return its index"""
+        return self.extend([xyz])
+
+    def extend(self, xyzs):
+        """Add a list of polygons; return the index of the first one"""
+        npts = np.array([len(xyz) for xyz in xyzs], dtype=int)
+        first, nv = self.num_polys, self.num_vertices
+        self._vertices = _grow(self._vertices, nv + npts.sum())
+        self._offsets = _grow(self._offsets, first + len(xyzs) + 1)
+        if len(xyzs):
+            self._vertices[nv:nv + npts.sum()] = np.concatenate(xyzs)
+        self._offsets[first + 1:first + len(xyzs) + 1] = nv + np.cumsum(npts)
+        self.num_polys += len(xyzs)
+        self.num_vertices += npts.sum()
+        return first
+
+
 class PolyView3D(plt.Axes):
     def __init__(self, view=(0, 0, 10), fig=None,
                  rect=[0, 0, 1, 1], **kwargs):
@@ -25,10 +85,17 @@ class PolyView3D(plt.Axes):
         self._button2 = False
         self._event_xy = None
         self._current_rot = self.start_rot
-        self._npts = [1]
-        self._xyzs = [[0, 0, 0]]
-        self._xys = [[0, 0]]
-        self._polys = []
+
+        # 3D polygons, their projection, and per-polygon colors.  The paths
+        # of the collection are views into self._xys, so a new projection
+        # only has to be written into that array.
+        self._arena = GeometryArena()
+        self._xys = np.zeros((self._arena.capacity, 2))
+        self._facecolors = np.zeros((self._arena.capacity, 4))
+        self._edgecolors = np.zeros((self._arena.capacity, 4))
+        self._linewidths = np.zeros(self._arena.capacity)
+        self._paths = []
+        self._projection_stale = False
 
         # initialize the axes.  We'll set some keywords by default
         kwargs.update(dict(aspect='equal',
@@ -38,6 +105,9 @@ class PolyView3D(plt.Axes):
         self.xaxis.set_major_formatter(plt.NullFormatter())
         self.yaxis.set_major_formatter(plt.NullFormatter())
 
+        self._collection = PolyCollection([], closed=False)
+        self.add_collection(self._collection, autolim=False)
+
         # connect some GUI events
         self.figure.canvas.mpl_connect('button_press_event',
                                        self._mouse_press)
@@ -58,15 +128,19 @@ class PolyView3D(plt.Axes):
         xyz : array_like
             an array of vertices, shape is (Npts, 3)
         **kwargs :
-            additional arguments are passed to plt.Polygon
+            ``facecolor``/``fc``, ``edgecolor``/``ec``, ``linewidth``/``lw``
+            and ``alpha`` of this polygon.
         """
-        xyz = np.asarray(xyz)
-        self._npts.append(self._npts[-1] + xyz.shape[0])
-        self._xyzs = np.vstack([self._xyzs, xyz])
+        kwargs = dict((key, [value]) for key, value in kwargs.items())
+        self.poly3D_batch([np.asarray(xyz, dtype=float)], **kwargs)
 
-        self._polys.append(plt.Polygon(xyz[:, :2], **kwargs))
-        self.add_patch(self._polys[-1])
-        self._update_projection()
+    # Per-polygon properties and the arrays that hold them.  All polygons
+    # are drawn by one PolyCollection, so other PolyCollection properties
+    # cannot be set per polygon and are not accepted.
+    _poly_keys = dict(facecolor='_facecolors', fc='_facecolors',
+                      edgecolor='_edgecolors', ec='_edgecolors',
+                      linewidth='_linewidths', lw='_linewidths',
+                      alpha=None)
 
     def poly3D_batch(self, xyzs, **kwargs):
         """Add multiple 3D polygons to the axes.
@@ -77,41 +151,86 @@ class PolyView3D(plt.Axes):
                 kwargs_i = dict([(key, kwargs[key][i]) for key in keys])
                 ax.poly3D(xyzs[i], **kwargs_i)
 
-        But it is much more efficient (it avoids redrawing each time).
+        but it is much more efficient.  The polygons are appended to a
+        growable vertex arena and all of them are drawn by a single
+        ``PolyCollection``; projection happens once, at the next draw.
 
         Parameters
         xyzs : list
             each item of xyzs is an array of shape (Npts, 3) where Npts may
             be different for each item
         **kwargs :
-            additional arguments should be lists of the same length as xyzs,
-            and each item will be passed to the ``plt.Polygon`` constructor.
+            ``facecolor``/``fc``, ``edgecolor``/``ec``, ``linewidth``/``lw``
+            and ``alpha`` should be lists of the same length as xyzs (one
+            value per polygon).  Other keywords raise TypeError.
         """
-        N = len(xyzs)
-        kwds = [dict([(key, kwargs[key][i]) for key in kwargs])
-                for i in xrange(N)]
-        polys = [plt.Polygon(xyz[:, :2], **kwd)
-                 for (xyz, kwd) in zip(xyzs, kwds)]
-        npts = self._npts[-1] + np.cumsum([len(xyz) for xyz in xyzs])
-        self._polys += polys
-        self._npts += list(npts)
-        self._xyzs = np.vstack([self._xyzs] + xyzs)
-        self._xys = np.array(self._xyzs[:, :2], dtype=np.float_)
-
-        [self.add_patch(p) for p in polys]
-        self._update_projection()
+        unknown = set(kwargs) - set(self._poly_keys)
+        if unknown:
+            raise TypeError('unsupported per-polygon properties: %s'
+                            % ', '.join(sorted(unknown)))
+        first = self._arena.extend([np.asarray(xyz, dtype=float)
+                                    for xyz in xyzs])
+        last = self._arena.num_polys
+        self._facecolors = _grow(self._facecolors, last)
+        self._edgecolors = _grow(self._edgecolors, last)
+        self._linewidths = _grow(self._linewidths, last)
+        self._facecolors[first:last] = to_rgba_array(plt.rcParams['patch.facecolor'])
+        self._edgecolors[first:last] = 0.
+        self._linewidths[first:last] = plt.rcParams['patch.linewidth']
+        alpha = kwargs.pop('alpha', None)
+        for key, value in kwargs.items():
+            values = getattr(self, self._poly_keys[key])
+            values[first:last] = to_rgba_array(value) if values.ndim == 2 else value
+        if alpha is not None:
+            # as in matplotlib, alpha replaces the alpha of both colors
+            self._facecolors[first:last, 3] = alpha
+            self._edgecolors[first:last, 3] = alpha
+
+        if self._arena.capacity != len(self._xys):
+            # the arena was reallocated: the paths must view the new buffer
+            self._xys = np.zeros((self._arena.capacity, 2))
+            first = 0
+            del self._paths[:]
+        offsets = self._arena.offsets
+        self._paths += [Path(self._xys[offsets[i]:offsets[i + 1]])
+                        for i in xrange(first, last)]
+        self._projection_stale = True
+        self.stale = True
 
     def rotate(self, rot):
-        self._current_rot = self._current_rot * rot
+        # renormalize so round-off does not accumulate over many small rotations
+        self._current_rot = (self._current_rot * rot).normalized()
 
     def _update_projection(self):
-        proj = project_points(self._xyzs, self._current_rot, self.view)
-        for i in xrange(len(self._polys)):
-            p = proj[self._npts[i]:self._npts[i + 1]]
-            self._polys[i].set_xy(p[:, :2])
-            self._polys[i].set_zorder(-p[:-1, 2].mean())
+        self._projection_stale = True
         self.figure.canvas.draw()
 
+    def _project(self):
+        # Project the arena into the buffer viewed by the paths, then
+        # restack the paths back to front by mean depth.  The last vertex
+        # of each polygon repeats the first, so it is left out of the mean.
+        arena = self._arena
+        nv, offsets = arena.num_vertices, arena.offsets
+        if arena.num_polys == 0:
+            return
+        proj = project_points(arena.vertices, self._current_rot, self.view)
+        self._xys[:nv] = proj[:, :2]
+        depth = np.add.reduceat(proj[:, 2], offsets[:-1]) - proj[offsets[1:] - 1, 2]
+        depth /= np.maximum(np.diff(offsets) - 1, 1)
+        order = np.argsort(-depth, kind='mergesort')
+
+        paths = self._paths
+        self._collection.get_paths()[:] = [paths[i] for i in order]
+        self._collection.set_facecolor(self._facecolors[order])
+        self._collection.set_edgecolor(self._edgecolors[order])
+        self._collection.set_linewidth(self._linewidths[order])
+        self._projection_stale = False
+
+    def draw(self, renderer, *args, **kwargs):
+        if self._projection_stale:
+            self._project()
+        super(PolyView3D, self).draw(renderer, *args, **kwargs)
+
     def _key_press(self, event):
         """Handler for key press events"""
         if event.key == 'shift':
@@ -216,16 +335,17 @@ def cube_axes(N=1, **kwargs):
     factor = np.array([1. / N, 1. / N, 1])
 
     ax = PolyView3D(**kwargs)
-    facecolor = []
-    polys = []
-
-    for t in translations:
-        base_face_trans = factor * base_face + t
-        base_sticker_trans = factor * base_sticker + t
-        for r, c in zip(rots, colors):
-            polys += [r.rotate(base_face_trans),
-                      r.rotate(base_sticker_trans)]
-            facecolor += ['k', c]
+
+    # rotate all translated faces and stickers at once: shape (N*N, 6, Npts, 3)
+    M = Quaternion(np.array([r.x for r in rots])).as_rotation_matrix()
+    faces = np.einsum('tpj,rij->trpi',
+                      factor * base_face + translations[:, None], M)
+    stickers = np.einsum('tpj,rij->trpi',
+                         factor * base_sticker + translations[:, None], M)
+
+    polys = [p for t in xrange(N * N) for r in xrange(len(rots))
+             for p in (faces[t, r], stickers[t, r])]
+    facecolor = [fc for t in xrange(N * N) for c in colors for fc in ('k', c)]
 
     ax.poly3D_batch(polys, facecolor=facecolor)
 
@@ -0,0 +1,132 @@
+'''
+============================================================
+Speculative solving of the cube in a background thread.
+
+While the user plays, InteractiveCube.rotate_face submits every state
+it reaches. A worker thread solves the latest one and drops the stale
+ones: a new submission stops the search in progress. Solutions go into
+a transposition cache keyed by the Zobrist hash of the state
+(Cube.zobrist), so states seen before are answered at once and "Solve
+Cube" usually finds its moves ready.
+
+Every state is first answered with the moves that undo the move list,
+then, if a solver exists for the cube size, with a shorter solution:
+the 2x2x2 distance table (pocket_cube.py) or, within max_moves, the
+IDA* solver (ida_star.py) for the 3x3x3. A 2x2x2 solution ends with
+the whole-cube rotation that restores the starting orientation, since
+the table solves it only up to a rotation. The solver is set up when the
+BackgroundSolver is created: the 2x2x2 table is loaded or built, but
+the 3x3x3 solver is only used if its tables were built beforehand
+("python ida_star.py"), and its search runs in a worker process, not
+in the GUI process. Moves are (face, turns, layer) tuples for
+InteractiveCube.rotate_face.
+
+- ax.solver = BackgroundSolver(N); ax.solver.solution(ax.cube.zobrist)
+============================================================
+'''
+import os, threading
+from collections import OrderedDict
+import notation
+from ida_star import TABLE_DIR
+
+class BackgroundSolver(object):
+    '''Solves submitted cube states in a daemon thread, keeping the solutions of the last
+    cache_size states. Tables of the solvers are read from cache_dir (TABLE_DIR if None).'''
+    def __init__(self, N, cache_size=10000, cache_dir=None, max_moves=12):
+        self.N = N
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir or TABLE_DIR
+        self.max_moves = max_moves
+        # key -> (moves, solved): solved is True if the moves come from the solver rather
+        # than from the move list, so the state need not be solved again.
+        self._cache = OrderedDict()
+        self._condition = threading.Condition()
+        self._request = None
+        self._closed = False
+        self._solver = self._make_solver()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._stop()
+            self._condition.notify_all()
+        self._thread.join()
+        if hasattr(self._solver, 'close'):
+            self._solver.close()
+
+    def submit(self, key, color_id, move_list):
+        '''Asks for a solution of the state with Zobrist hash key, given by its color_id()
+        array and the move list that led to it. Stops the solve in progress.'''
+        with self._condition:
+            self._request = (key, color_id, list(move_list))
+            self._stop()
+            self._condition.notify_all()
+
+    def solution(self, key, timeout=0.):
+        '''Returns the cached moves that solve the state key, waiting up to timeout
+        seconds for them; None if there are none yet.'''
+        with self._condition:
+            if key not in self._cache and timeout > 0:
+                self._condition.wait(timeout)
+            if key not in self._cache:
+                return None
+            self._cache[key] = entry = self._cache.pop(key)
+            return entry[0]
+
+    def _store(self, key, moves, solved=False):
+        # Keeps the shorter of the cached and the new moves, dropping the least recently
+        # used states beyond cache_size.
+        with self._condition:
+            cached, cached_solved = self._cache.pop(key, (None, False))
+            if cached is not None and len(cached) <= len(moves):
+                moves = cached
+            self._cache[key] = (moves, solved or cached_solved)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._condition.notify_all()
+
+    def _stop(self):
+        if self._solver is not None and hasattr(self._solver, 'stop'):
+            self._solver.stop()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                key, color_id, move_list = self._request
+                self._request = None
+                if key in self._cache and self._cache[key][1]:
+                    continue
+                if hasattr(self._solver, 'resume'):
+                    self._solver.resume()
+            self._store(key, [(face, -turns, layer) for face, turns, layer in move_list[::-1]])
+            text = self._solve(color_id)
+            if text is not None:
+                self._store(key, [(face, d, l) for face, l, d in notation.parse(text, self.N)], solved=True)
+
+    def _make_solver(self):
+        # The solver of the cube size, or None.
+        if self.N == 2:
+            from pocket_cube import pocket_cube_table
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            return pocket_cube_table(os.path.join(self.cache_dir, 'pocket_cube.npy'))
+        if self.N == 3:
+            from ida_star import SolverTables, ParallelSolver
+            if SolverTables.exist(self.cache_dir):
+                return ParallelSolver(workers=1, split_depth=1, cache_dir=self.cache_dir, use_pool=True)
+        return None
+
+    def _solve(self, color_id):
+        # Move string of a short solution, or None if the solver gave up or there is none.
+        if self._solver is None:
+            return None
+        if self.N == 2:
+            return self._solver.solve(color_id, reorient=True)
+        return self._solver.solve(color_id, max_moves=self.max_moves)
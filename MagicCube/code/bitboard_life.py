@@ -0,0 +1,215 @@
+'''
+============================================================
+Bit-parallel Game of Life on graphs of at most 64 cells.
+
+A generation of the 3x3x3 cube surface (54 stickers) is one 64-bit
+word: bit i is the state of the i-th node of the graph. The next
+generation is computed by bitwise adder logic: the neighbor states of
+all cells are added at once into bit-sliced counters (ones, twos, and
+a saturating "four or more"), and the rule is a few word operations
+on the counters.
+
+- game = BitboardGameOfLife(g, live) has the API of GameOfLife
+  (tick(), live = dict of cell-to-age); ages are kept in a side array.
+- BitboardGameOfLife.run(boards, ticks) advances a uint64 array of
+  boards: the boards are transposed into 64-board bit planes, one word
+  per cell, and every tick is one gather of the neighbor planes plus a
+  carry-save adder tree over all cells and boards. On the cube surface,
+  "bitboard_life.py cube_surface_graph.csr" (10 ticks of 2^20 boards)
+  measured about 29M board ticks per second on one core (20M with one
+  gather per neighbor and sequential adds); the figure depends on the
+  machine.
+============================================================
+'''
+import numpy as np
+
+def neighbor_masks(g, nodes):
+  # Returns the list of bit masks of the neighbors of each node.
+  bit = dict((u, i) for i, u in enumerate(nodes))
+  return [sum(1 << bit[v] for v in g.neighbors(u)) for u in nodes]
+
+def _add(counters, x):
+  # Adds the bit word(s) x into the bit-sliced saturating counters (ones, twos, more).
+  ones, twos, more = counters
+  carry = ones & x
+  return ones ^ x, twos ^ carry, more | (twos & carry)
+
+def _next(counters, alive):
+  # Born with exactly 3 live neighbors, survives with 2 or 3.
+  ones, twos, more = counters
+  return ~more & twos & (ones | alive)
+
+def _count(inputs, spare):
+  # Adds the bit plane arrays inputs (overwritten) with a carry-save adder tree, in place.
+  # Returns the counters (ones, twos, more) of _add(), among inputs and the two or more
+  # spare arrays spare.
+  ones, twos = list(inputs), []
+  while len(ones) > 2:
+    # Full adder: the sum of a, b, c goes to a and the carry to b.
+    a, b, c = ones[:3]
+    del ones[:3]
+    t = spare.pop()
+    np.bitwise_xor(a, b, out=t)
+    np.bitwise_and(a, b, out=b)
+    np.bitwise_xor(t, c, out=a)
+    np.bitwise_and(t, c, out=t)
+    b |= t
+    ones.append(a)
+    twos.append(b)
+    spare += [t, c]
+  if len(ones) == 2:
+    a, b = ones
+    t = spare.pop()
+    np.bitwise_and(a, b, out=t)
+    a ^= b
+    ones = [a]
+    twos.append(t)
+    spare.append(b)
+  # The carries (of weight 2) are added into the saturating counters twos and more.
+  more = spare.pop()
+  more[:] = 0
+  if not twos:
+    twos = [spare.pop()]
+    twos[0][:] = 0
+  for c in twos[1:]:
+    t = spare.pop()
+    np.bitwise_and(twos[0], c, out=t)
+    more |= t
+    twos[0] ^= c
+    spare += [t, c]
+  return ones[0], twos[0], more
+
+# Shifts and masks of the rounds of _transpose64(): round j swaps the bits c + j of the rows
+# r with the bits c of the rows r + j, for the r and c that have bit j clear.
+_TRANSPOSE_ROUNDS = [(j, np.uint64(j), np.uint64(sum(1 << c for c in xrange(64) if not c & j)))
+                     for j in (32, 16, 8, 4, 2, 1)]
+
+def _transpose64(words):
+  # Transposes in place the 64x64 bit matrices of the (W, 64) uint64 array words: bit c of row r
+  # becomes bit r of row c. Returns words.
+  for j, shift, mask in _TRANSPOSE_ROUNDS:
+    pairs = words.reshape(len(words), 32 // j, 2, j)
+    low, high = pairs[:, :, 0], pairs[:, :, 1]
+    swap = ((low >> shift) ^ high) & mask
+    high ^= swap
+    low ^= swap << shift
+  return words
+
+def to_planes(boards, num_cells):
+  # Transposes a uint64 array of B boards into a (num_cells, ceil(B / 64)) uint64 array of
+  # bit planes: bit b % 64 of word b // 64 of plane i is cell i of board b.
+  words = np.zeros(len(boards) + -len(boards) % 64, dtype=np.uint64)
+  words[:len(boards)] = boards
+  return np.ascontiguousarray(_transpose64(words.reshape(-1, 64)).T[:num_cells])
+
+def from_planes(planes, num_boards):
+  # Inverse of to_planes(): the uint64 array of the first num_boards boards of planes.
+  words = np.zeros((planes.shape[1], 64), dtype=np.uint64)
+  words[:, :len(planes)] = planes.T
+  return _transpose64(words).ravel()[:num_boards]
+
+class BitboardGameOfLife(object):
+  def __init__(self, g, live=()):
+    # Initializes a game of life on the undirected graph g (at most 64 nodes), starting with
+    # the initial configuration whose live cells are the list live.
+    self.g = g
+    self.nodes = sorted(g.nodes())
+    if len(self.nodes) > 64:
+      raise ValueError('%d cells do not fit in a 64-bit board' % len(self.nodes))
+    self._bit = dict((u, i) for i, u in enumerate(self.nodes))
+    self.masks = neighbor_masks(g, self.nodes)
+    # Neighbor bit numbers of each cell, padded with an always-dead cell (row num_cells of the
+    # bit planes) for cells of lower degree.
+    n = len(self.nodes)
+    degree = max(bin(m).count('1') for m in self.masks)
+    self._neighbors = np.empty((degree, n), dtype=int)
+    self._neighbors.fill(n)
+    for i, m in enumerate(self.masks):
+      nbhrs = [j for j in xrange(n) if (m >> j) & 1]
+      self._neighbors[:len(nbhrs), i] = nbhrs
+    # The neighbors of a single board grouped by bit distance: (board >> shift) & mask has
+    # the state of cell i + shift at bit i, for the cells i that have that neighbor.
+    shifts = {}
+    for i, m in enumerate(self.masks):
+      for j in xrange(n):
+        if (m >> j) & 1:
+          shifts[j - i] = shifts.get(j - i, 0) | (1 << i)
+    self._shifts = sorted(shifts.items())
+    self._all = (1 << n) - 1
+    self._cells = np.arange(n, dtype=np.uint64)
+    # Ages of the cells of the board (0 = dead).
+    self.ages = np.zeros(n, dtype=np.uint32)
+    self.board = self.pack(live)
+
+  def pack(self, live):
+    # Returns the board word of the list of live cells live, and sets their age to 1.
+    self.ages[:] = 0
+    board = 0
+    for u in live:
+      board |= 1 << self._bit[u]
+      self.ages[self._bit[u]] = 1
+    return board
+
+  @property
+  def live(self):
+    # Dictionary of live cell-location-to-cell-age, as in GameOfLife.
+    return dict((self.nodes[i], int(self.ages[i])) for i in np.flatnonzero(self.ages))
+
+  @live.setter
+  def live(self, live):
+    self.board = self.pack(live)
+
+  def key(self):
+    # Returns a hashable key of the set of live cells (the board word).
+    return self.board
+
+  def population(self):
+    return bin(self.board).count('1')
+
+  def step(self, board):
+    # Returns the generation after the board word board.
+    counters = (0, 0, 0)
+    for shift, mask in self._shifts:
+      counters = _add(counters, (board >> shift if shift > 0 else board << -shift) & mask)
+    return _next(counters, board) & self._all
+
+  def tick(self):
+    # Advances the state to the next time step (tick).
+    self.board = self.step(self.board)
+    alive = (np.uint64(self.board) >> self._cells) & np.uint64(1)
+    self.ages = (self.ages + 1) * alive.astype(np.uint32)
+
+  def run(self, boards, ticks, block=1 << 14):
+    # Returns the uint64 array of the generations ticks ticks after the boards boards. Boards
+    # are advanced block at a time, so that the bit planes stay in the cache.
+    boards = np.asarray(boards, dtype=np.uint64)
+    result = np.empty_like(boards)
+    n = len(self.nodes)
+    for start in xrange(0, len(boards), block):
+      chunk = boards[start:start + block]
+      planes = np.vstack([to_planes(chunk, n), np.zeros((1, (len(chunk) + 63) // 64), dtype=np.uint64)])
+      # The neighbor planes of all cells, gathered at once, and spare counter arrays.
+      x = np.empty((len(self._neighbors), n, planes.shape[1]), dtype=np.uint64)
+      spare = [np.empty_like(planes[:n]) for _ in xrange(2)]
+      for _ in xrange(ticks):
+        # _add() and _next() in place, on the 64 boards of each word at once.
+        np.take(planes, self._neighbors, axis=0, out=x)
+        ones, twos, more = _count(x, list(spare))
+        ones |= planes[:n]
+        ones &= twos
+        np.invert(more, out=more)
+        np.bitwise_and(ones, more, out=planes[:n])
+      result[start:start + block] = from_planes(planes[:n], len(chunk))
+    return result
+
+if __name__ == '__main__':
+  import sys, time
+  from csr_graph import load_graph
+  if len(sys.argv) != 2:
+    print 'Usage: bitboard_life.py <neighbors-graph-file>'
+    sys.exit(1)
+  game = BitboardGameOfLife(load_graph(sys.argv[1]))
+  boards = np.random.randint(0, 1 << 62, size=1 << 20).astype(np.uint64) & np.uint64(game._all)
+  t = time.time()
+  game.run(boards, 10)
+  print '%.1fM board ticks per second' % (10 * len(boards) / 1e6 / (time.time() - t))
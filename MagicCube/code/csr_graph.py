@@ -0,0 +1,155 @@
+'''
+============================================================
+Compact adjacency (CSR) of an undirected graph.
+
+The neighbors of node u (nodes are 0..n-1) are
+indices[indptr[u]:indptr[u + 1]], sorted. The graph answers the part
+of the networkx Graph API the Game of Life code uses (nodes(),
+neighbors(), degree(), number_of_nodes(), number_of_edges()), and
+matrix() is its scipy.sparse adjacency matrix.
+
+- graph = CsrGraph.from_networkx(g)
+- graph = CsrGraph.from_edges(n, edges)
+
+On disk, a graph is a .csr file: a 24-byte header (magic 'CSRG',
+format version, number of nodes n, number of entries m), then indptr
+as n + 1 little-endian int64 and indices as m little-endian int32.
+CsrGraph.load() memory-maps the arrays, so loading takes no time and
+needs neither networkx nor unpickling; load_graph() also reads
+line-adjacency .dat files and the older networkx pickles (which need
+networkx to unpickle), and "csr_graph.py <input> <output.csr>"
+converts them.
+============================================================
+'''
+import os, struct, sys, itertools as it
+import numpy as np
+
+# File header: magic, version, number of nodes, number of entries of indices.
+_HEADER = struct.Struct('<4sIQQ')
+_MAGIC = 'CSRG'
+_VERSION = 1
+
+class CsrGraph(object):
+  def __init__(self, indptr, indices):
+    # Initializes the graph from its CSR arrays indptr (n + 1 offsets) and indices.
+    self.indptr = np.asarray(indptr)
+    self.indices = np.asarray(indices)
+
+  @staticmethod
+  def from_edges(n, edges):
+    # Returns the graph on the nodes 0..n-1 with the undirected edges edges, an (m, 2) array or
+    # a list of pairs. Self-loops and repeated edges are dropped.
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    pairs = np.unique(np.concatenate([edges[:, 0] * n + edges[:, 1], edges[:, 1] * n + edges[:, 0]]))
+    rows, cols = pairs // n, pairs % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=n))
+    return CsrGraph(indptr, cols.astype(np.int32))
+
+  @staticmethod
+  def from_networkx(g):
+    # Returns the CSR graph of the networkx graph g, whose nodes must be 0..n-1.
+    n = g.number_of_nodes()
+    if sorted(g.nodes()) != range(n):
+      raise ValueError('Graph nodes are not 0..%d' % (n - 1))
+    return CsrGraph.from_edges(n, [(u, v) for u in g.nodes() for v in g.neighbors(u)])
+
+  def save(self, file_name):
+    # Writes the graph to the .csr file file_name.
+    with open(file_name, 'wb') as f:
+      f.write(_HEADER.pack(_MAGIC, _VERSION, self.number_of_nodes(), len(self.indices)))
+      f.write(np.ascontiguousarray(self.indptr, dtype='<i8').tostring())
+      f.write(np.ascontiguousarray(self.indices, dtype='<i4').tostring())
+
+  @staticmethod
+  def load(file_name):
+    # Returns the graph of the .csr file file_name, its arrays memory-mapped (read-only).
+    with open(file_name, 'rb') as f:
+      magic, version, n, m = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC or version != _VERSION:
+      raise ValueError('%s is not a version %d CSR graph file' % (file_name, _VERSION))
+    if os.path.getsize(file_name) != _HEADER.size + 8 * (n + 1) + 4 * m:
+      raise ValueError('%s is truncated' % file_name)
+    indptr = np.memmap(file_name, dtype='<i8', mode='r', offset=_HEADER.size, shape=(n + 1,))
+    indices = np.memmap(file_name, dtype='<i4', mode='r', offset=_HEADER.size + 8 * (n + 1), shape=(m,)) \
+      if m else np.zeros(0, dtype='<i4')
+    return CsrGraph(indptr, indices)
+
+  def number_of_nodes(self):
+    return len(self.indptr) - 1
+
+  def number_of_edges(self):
+    return len(self.indices) // 2
+
+  def nodes(self):
+    return range(self.number_of_nodes())
+
+  def neighbors(self, u):
+    return self.indices[self.indptr[u]:self.indptr[u + 1]].tolist()
+
+  # For GameOfLife, written for the networkx 1.x API.
+  neighbors_iter = neighbors
+
+  def degree(self, u):
+    return int(self.indptr[u + 1] - self.indptr[u])
+
+  def degrees(self):
+    # Array of the degrees of all nodes.
+    return np.diff(self.indptr)
+
+  def matrix(self, dtype=np.uint8):
+    # Returns the adjacency matrix as a scipy.sparse.csr_matrix with entries of type dtype.
+    import scipy.sparse
+    n = self.number_of_nodes()
+    return scipy.sparse.csr_matrix((np.ones(len(self.indices), dtype=dtype), self.indices, self.indptr),
+                                   shape=(n, n))
+
+def line_edges(a, b):
+  # Returns the list of nearest-neighbor edges between the cells of two 3-cell lines a and b.
+  return it.chain(((a[i], b[i + 1]) for i in xrange(2)), ((a[i + 1], b[i]) for i in xrange(2)),
+                  ((a[i], a[i + 1]) for i in xrange(2)), ((b[i + 1], b[i]) for i in xrange(2)),
+                  ((a[i], b[i]) for i in xrange(3)))
+
+def line_adjacency_edges(file_name):
+  # Returns the list of edges of the 3x3x3 cube Game of Life neighbor graph given a file
+  # of line adjacencies (see nearest_neighbors_graph.py).
+  with open(file_name, 'rb') as f:
+    line, line_prev, edge_list = [], [], []
+    for line in (map(int, line.strip().split()) for line in f):
+      if line and line_prev:
+        for edge in line_edges(line_prev, line): edge_list.append(edge)
+      line_prev = line
+  return edge_list
+
+def read_pickle_graph(file_name):
+  # Returns the CsrGraph of a pickled networkx Graph (nx.write_gpickle). networkx must be
+  # importable to unpickle it, but the graph may come from another networkx version (1.x or 2.x):
+  # the adjacency dictionary is read directly.
+  import cPickle
+  with open(file_name, 'rb') as f:
+    g = cPickle.load(f)
+  adjacency = g.__dict__.get('_adj', g.__dict__.get('adj'))
+  n = len(adjacency)
+  if sorted(adjacency) != range(n):
+    raise ValueError('Graph nodes are not 0..%d' % (n - 1))
+  return CsrGraph.from_edges(n, [(u, v) for u in adjacency for v in adjacency[u]])
+
+def load_graph(file_name):
+  # Returns the CsrGraph of a .csr file (memory-mapped), a networkx pickle or a line-adjacency .dat
+  # file (see nearest_neighbors_graph.py).
+  if file_name.endswith('.dat'):
+    edges = np.array(line_adjacency_edges(file_name))
+    return CsrGraph.from_edges(edges.max() + 1, edges)
+  with open(file_name, 'rb') as f:
+    magic = f.read(len(_MAGIC))
+  return CsrGraph.load(file_name) if magic == _MAGIC else read_pickle_graph(file_name)
+
+if __name__ == '__main__':
+  # Converts a graph file to the .csr format.
+  if len(sys.argv) != 3:
+    print 'Usage: csr_graph.py <graph-pickle-or-dat-file> <output-csr-file>'
+    sys.exit(1)
+  g = load_graph(sys.argv[1])
+  g.save(sys.argv[2])
+  print 'Wrote %d nodes, %d edges to %s' % (g.number_of_nodes(), g.number_of_edges(), sys.argv[2])
@@ -24,8 +24,9 @@ usage
 -----
 - initialize a solved cube with `c = Cube(N)` where `N` is the side length.
 - randomize a cube with `c.randomize(32)` where `32` is the number of random moves to make.
-- make cube moves with `c.move()` and turn the whole cube with `c.turn()`.
+- make cube moves with `c.move()` and turn the whole cube with `c.turn()`, eg, `c.turn("x", 1)`.
 - make figures with `c.render().savefig(fn)` where `fn` is the filename.
+- make animations with `render_frames(c, moves, pattern="frame%04d.png", movie="moves.gif")`.
 - change sticker colors with, eg, `c.stickercolors[c.colordict["w"]] = "k"`.
 
 conventions
@@ -46,10 +47,34 @@ to-do
 
 """
 
+import copy
+import subprocess
+import multiprocessing
+import itertools as it
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-from matplotlib.patches import Polygon
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba_array
+from projection import visible_order
+import zobrist
+
+def _orient(a, o):
+    """
+    Apply symmetry `o` (0 to 7) of the square to the 2-d array `a`: a
+    transpose if `o >= 4`, followed by `o % 4` calls of `np.rot90`.
+    Returns a view.
+    """
+    if o >= 4:
+        a = a.T
+    return np.rot90(a, o % 4)
+
+# _D4_PRODUCT[a, b] is the symmetry `_orient(_orient(x, b), a)`.
+_D4_SQUARES = [_orient(np.arange(9).reshape(3, 3), o) for o in xrange(8)]
+_D4_PRODUCT = np.array([[[np.array_equal(_orient(_D4_SQUARES[b], a), x) for x in _D4_SQUARES].index(True)
+                         for b in xrange(8)] for a in xrange(8)])
 
 class Cube(object):
     """
@@ -68,6 +93,10 @@ class Cube(object):
     xdirs = [np.array([1., 0., 0.]), np.array([1., 0., 0.]),
                np.array([1., 0., 0.]), np.array([-1., 0., 0.]),
                np.array([0., 0., -1.]), np.array([0, 0., 1.])]
+    oppositeface = {"U":"D", "D":"U", "F":"B", "B":"F", "R":"L", "L":"R"}
+    # whole-cube rotation axes, named as in cube notation
+    axisdict = {"x":"R", "y":"U", "z":"F"}
+    _frame_turns = {}
     colordict = {"w":0, "y":1, "b":2, "g":3, "o":4, "r":5}
     pltpos = [(0., 1.05), (0., -1.05), (0., 0.), (2.10, 0.), (1.05, 0.), (-1.05, 0.)]
     labelcolor = "#7f00ff"
@@ -77,7 +106,16 @@ class Cube(object):
         (see above)
         """
         self.N = N
-        self.stickers = np.array([np.tile(i, (self.N, self.N)) for i in xrange(6)])
+        # Sticker colors are stored as uint8, face by face.  Face `i` is
+        # `_orient(self._stickers[self._frame[i]], self._orientation[i])` (see
+        # `stickers`), so that turning a face or the whole cube only updates
+        # these tags.
+        self._stickers = np.repeat(np.arange(6, dtype=np.uint8), N * N).reshape(6, N, N)
+        self._frame = np.arange(6)
+        self._orientation = np.zeros(6, dtype=int)
+        # Zobrist hashes of each face under the 8 symmetries (see `zobrist`),
+        # computed on first use
+        self._zobrist = None
         self.stickercolors = ["w", "#ffcf00", "#00008f", "#009f0f", "#ff6f00", "#cf0000"]
         self.stickerthickness = 0.001 # sticker thickness in units of total cube size
         self.stickerwidth = 0.9 # sticker size relative to cubie size (must be < 1)
@@ -86,18 +124,109 @@ class Cube(object):
         else:
             self.plasticcolor = "#1f1f1f"
         self.fontsize = 12. * (self.N / 5.)
+        self.verbose = True # print every move
         return None
 
+    @property
+    def stickers(self):
+        """
+        The `(6, N, N)` array of sticker colors.  Applies the pending face
+        and whole-cube rotations first, so the returned array can also be
+        modified; assign it back (`c.stickers = s`) to keep `zobrist` valid.
+        """
+        if np.any(self._frame != np.arange(6)) or np.any(self._orientation):
+            self._stickers = np.array([self._face(i) for i in xrange(6)])
+            self._frame = np.arange(6)
+            self._orientation[:] = 0
+        return self._stickers
+
+    @stickers.setter
+    def stickers(self, stickers):
+        self._stickers = np.array(stickers, dtype=np.uint8)
+        self._frame = np.arange(6)
+        self._orientation[:] = 0
+        self._zobrist = None
+
+    @property
+    def zobrist(self):
+        """
+        Zobrist hash of the sticker colors, as a 64-bit integer.  Kept up
+        to date by `move()` at the cost of the stickers it moves; computed
+        again from scratch after `turn()` or a new `stickers` array.
+        Each face carries its hash under all 8 symmetries of the square,
+        so face turns only permute them.
+        """
+        if self._zobrist is None:
+            flat = np.arange(self.N * self.N)
+            self._zobrist = np.array([[zobrist.hash_values(slots, self._face(i).ravel())
+                                       for slots in self._slots(i, flat)]
+                                      for i in xrange(6)])
+        return int(np.bitwise_xor.reduce(self._zobrist[:, 0]))
+
+    def _slots(self, i, flat):
+        """
+        Internal function for the `zobrist` property.  The Zobrist slot
+        numbers, shape `(8, len(flat))`, of the stickers at flat positions
+        `flat` of face `i` once the face is transformed by each `_orient()`
+        symmetry.
+        """
+        N = self.N
+        a, b = flat // N, flat % N
+        ra, rb = N - 1 - a, N - 1 - b
+        # (a, b) after o % 4 quarter turns, without and with transposing first
+        rows = np.array([a, rb, ra, b, b, ra, rb, a])
+        cols = np.array([b, a, rb, ra, a, b, ra, rb])
+        return (i * N + rows) * N + cols
+
+    def _face(self, i):
+        """
+        Internal function for the `move()` function.  A view of the
+        stickers of face `i` in standard orientation.
+        """
+        return _orient(self._stickers[self._frame[i]], self._orientation[i])
+
     def turn(self, f, d):
         """
         Turn whole cube (without making a layer move) around face `f`
         `d` 90-degree turns in the clockwise direction.  Use `d=3` or
-        `d=-1` for counter-clockwise.
+        `d=-1` for counter-clockwise.  `f` can also be one of the axes
+        of `Cube.axisdict`, as in the `x`, `y` and `z` cube rotations.
+        The turn is a relabeling of the faces, so it takes constant time.
         """
-        for l in xrange(self.N):
-            self.move(f, l, d)
+        f = self.axisdict.get(f, f)
+        if f in "DBL":
+            return self.turn(self.oppositeface[f], -d)
+        frame, orientation = self._frame_turn(f)
+        self._zobrist = None
+        for _ in xrange((d + 4) % 4):
+            self._frame = self._frame[frame]
+            self._orientation = _D4_PRODUCT[orientation, self._orientation[frame]]
         return None
 
+    @classmethod
+    def _frame_turn(cls, f):
+        """
+        Internal function for the `turn()` function.  The face relabeling
+        of a clockwise whole-cube turn around face `f`: after the turn,
+        face `i` is `_orient(old face frame[i], orientation[i])`.  Found
+        once per face by turning a 3x3x3 cube of numbered stickers layer
+        by layer.
+        """
+        if f not in cls._frame_turns:
+            c = cls(3)
+            c.verbose = False
+            c.stickers = np.arange(54).reshape(6, 3, 3)
+            start = c.stickers.copy()
+            for l in xrange(3):
+                c.move(f, l, 1)
+            frame, orientation = np.zeros(6, dtype=int), np.zeros(6, dtype=int)
+            for i in xrange(6):
+                frame[i] = np.nonzero(start[:, 1, 1] == c.stickers[i, 1, 1])[0][0]
+                orientation[i] = [np.array_equal(_orient(start[frame[i]], o), c.stickers[i])
+                                  for o in xrange(8)].index(True)
+            cls._frame_turns[f] = frame, orientation
+        return cls._frame_turns[f]
+
     def move(self, f, l, d):
         """
         Make a layer move of layer `l` parallel to face `f` through
@@ -109,66 +238,89 @@ class Cube(object):
         i = self.facedict[f]
         l2 = self.N - 1 - l
         assert l < self.N
-        ds = xrange((d + 4) % 4)
+        d = (d + 4) % 4
+        # whole rows and columns, forwards and backwards
+        fw, bw = slice(None), slice(None, None, -1)
         if f == "U":
             f2 = "D"
             i2 = self.facedict[f2]
-            for d in ds:
-                self._rotate([(self.facedict["F"], xrange(self.N), l2),
-                              (self.facedict["R"], xrange(self.N), l2),
-                              (self.facedict["B"], xrange(self.N), l2),
-                              (self.facedict["L"], xrange(self.N), l2)])
+            self._rotate([(self.facedict["F"], fw, l2),
+                          (self.facedict["R"], fw, l2),
+                          (self.facedict["B"], fw, l2),
+                          (self.facedict["L"], fw, l2)], d)
         if f == "D":
             return self.move("U", l2, -d)
         if f == "F":
             f2 = "B"
             i2 = self.facedict[f2]
-            for d in ds:
-                self._rotate([(self.facedict["U"], xrange(self.N), l),
-                              (self.facedict["L"], l2, xrange(self.N)),
-                              (self.facedict["D"], xrange(self.N)[::-1], l2),
-                              (self.facedict["R"], l, xrange(self.N)[::-1])])
+            self._rotate([(self.facedict["U"], fw, l),
+                          (self.facedict["L"], l2, fw),
+                          (self.facedict["D"], bw, l2),
+                          (self.facedict["R"], l, bw)], d)
         if f == "B":
             return self.move("F", l2, -d)
         if f == "R":
             f2 = "L"
             i2 = self.facedict[f2]
-            for d in ds:
-                self._rotate([(self.facedict["U"], l2, xrange(self.N)),
-                              (self.facedict["F"], l2, xrange(self.N)),
-                              (self.facedict["D"], l2, xrange(self.N)),
-                              (self.facedict["B"], l, xrange(self.N)[::-1])])
+            self._rotate([(self.facedict["U"], l2, fw),
+                          (self.facedict["F"], l2, fw),
+                          (self.facedict["D"], l2, fw),
+                          (self.facedict["B"], l, bw)], d)
         if f == "L":
             return self.move("R", l2, -d)
-        for d in ds:
-            if l == 0:
-                self.stickers[i] = np.rot90(self.stickers[i], 3)
-            if l == self.N - 1:
-                self.stickers[i2] = np.rot90(self.stickers[i2], 1)
-        print "moved", f, l, len(ds)
+        # face turns only update the orientation tags
+        if l == 0:
+            self._orientation[i] = _D4_PRODUCT[(3 * d) % 4, self._orientation[i]]
+            if self._zobrist is not None:
+                self._zobrist[i] = self._zobrist[i, _D4_PRODUCT[:, (3 * d) % 4]]
+        if l == self.N - 1:
+            self._orientation[i2] = _D4_PRODUCT[d, self._orientation[i2]]
+            if self._zobrist is not None:
+                self._zobrist[i2] = self._zobrist[i2, _D4_PRODUCT[:, d]]
+        if self.verbose:
+            print "moved", f, l, d
         return None
 
-    def _rotate(self, args):
+    def _rotate(self, args, d=1):
         """
-        Internal function for the `move()` function.
+        Internal function for the `move()` function.  Cycles the rows or
+        columns `(face, row, column)` of `args` `d` times, each receiving
+        the stickers of the next one.
         """
-        a0 = args[0]
-        foo = self.stickers[a0]
-        a = a0
-        for b in args[1:]:
-            self.stickers[a] = self.stickers[b]
-            a = b
-        self.stickers[a] = foo
+        views = [self._face(i)[j, k] for i, j, k in args]
+        values = [v.copy() for v in views]
+        for a, v in enumerate(views):
+            v[...] = values[(a + d) % len(views)]
+        if self._zobrist is not None:
+            # All the views at once: XOR out the old colors, XOR in the new ones.
+            rows = np.arange(self.N)
+            slots = np.hstack([self._slots(i, np.ravel(rows[j] * self.N + rows[k]))
+                               for i, j, k in args])
+            old = np.hstack([np.ravel(v) for v in values])
+            new = np.hstack([np.ravel(v) for v in views])
+            starts = np.cumsum([0] + [np.size(v) for v in values[:-1]])
+            change = np.bitwise_xor.reduceat(zobrist.keys(slots, old) ^ zobrist.keys(slots, new),
+                                             starts, axis=1)
+            self._zobrist[[i for i, _, _ in args]] ^= change.T
         return None
 
-    def randomize(self, number):
+    def random_moves(self, number):
         """
-        Make `number` randomly chosen moves to scramble the cube.
+        Return a list of `number` randomly chosen `(f, l, d)` moves.
         """
+        moves = []
         for _ in xrange(number):
             f = self.dictface[np.random.randint(6)]
             l = np.random.randint(self.N)
             d = 1 + np.random.randint(3)
+            moves.append((f, l, d))
+        return moves
+
+    def randomize(self, number):
+        """
+        Make `number` randomly chosen moves to scramble the cube.
+        """
+        for f, l, d in self.random_moves(number):
             self.move(f, l, d)
         return None
 
@@ -176,72 +328,93 @@ class Cube(object):
         """
         Internal function for the `render()` function.  Clunky
         projection from 3-d to 2-d, but also return a zorder variable.
+        Works on a whole array of points (last axis of length 3) at once.
         """
+        points = np.asarray(points, dtype=float)
         v2 = np.dot(viewpoint, viewpoint)
         zdir = viewpoint / np.sqrt(v2)
         xdir = np.cross(np.array([0., 1., 0.]), zdir)
         xdir /= np.sqrt(np.dot(xdir, xdir))
         ydir = np.cross(zdir, xdir)
-        result = []
-        for p in points:
-            dpoint = p - viewpoint
-            dproj = 0.5 * dpoint * v2 / np.dot(dpoint, -1. * viewpoint)
-            result += [np.array([np.dot(xdir, dproj),
-                                 np.dot(ydir, dproj),
-                                 np.dot(zdir, dpoint / np.sqrt(v2))])]
-        return result
+        dpoint = points - viewpoint
+        dproj = 0.5 * dpoint * v2 / np.dot(dpoint, -1. * viewpoint)[..., None]
+        return np.concatenate([np.dot(dproj, xdir)[..., None],
+                               np.dot(dproj, ydir)[..., None],
+                               np.dot(dpoint, zdir / np.sqrt(v2))[..., None]], axis=-1)
+
+    def _faceframes(self):
+        """
+        Internal function for the `render()` function.  The (xdir,
+        ydir, zdir) unit vectors of all six faces, each of shape (6, 3).
+        """
+        zdirs = np.array(self.normals)
+        xdirs = np.array(self.xdirs)
+        ydirs = np.cross(zdirs, xdirs) # insanity: left-handed!
+        return xdirs, ydirs, zdirs
 
     def render_views(self, ax):
         """
         Make three projected 3-dimensional views of the cube for the
-        `render()` function.  Because of zorder / occulting issues,
-        this code is very brittle; it will not work for all viewpoints
-        (the `np.dot(zdir, viewpoint)` test is not general; the corect
-        test involves the "handedness" of the projected polygon).
+        `render()` function.  Faces whose projected plastic polygon
+        is wound the wrong way are turned away from the viewpoint and
+        are skipped; the rest are drawn back to front.  All sticker
+        polygons are projected at once and each view is drawn as one
+        `PolyCollection`.
         """
         csz = 2. / self.N
         x2 = 8.
         x1 = 0.5 * x2
+        psc = 1. - 2. * self.stickerthickness
+        xdirs, ydirs, zdirs = self._faceframes()
+        signs = np.array([[-1., -1.], [1., -1.], [1., 1.], [-1., 1.]])
+        corners = psc * (zdirs[:, None] + signs[None, :, 0, None] * xdirs[:, None]
+                         + signs[None, :, 1, None] * ydirs[:, None])
+        stickers = self._stickerpolygons(xdirs, ydirs, zdirs, csz)
+        nv = stickers.shape[-2]
+        stickers = stickers.reshape(6, -1, nv, 3)
+        plasticcolor = to_rgba_array(self.plasticcolor)
+        colors = to_rgba_array(self.stickercolors)[self.stickers].reshape(6, -1, 4)
         for viewpoint, shift in [(np.array([-x1, -x1, x2]), np.array([-1.5, 3.])),
                                  (np.array([x1, x1, x2]), np.array([0.5, 3.])),
                                  (np.array([x2, x1, -x1]), np.array([2.5, 3.]))]:
-            for f, i in self.facedict.items():
-                zdir = self.normals[i]
-                if np.dot(zdir, viewpoint) < 0:
-                    continue
-                xdir = self.xdirs[i]
-                ydir = np.cross(zdir, xdir) # insanity: left-handed!
-                psc = 1. - 2. * self.stickerthickness
-                corners = [psc * zdir - psc * xdir - psc * ydir,
-                           psc * zdir + psc * xdir - psc * ydir,
-                           psc * zdir + psc * xdir + psc * ydir,
-                           psc * zdir - psc * xdir + psc * ydir]
-                projects = self._render_points(corners, viewpoint)
-                xys = [p[0:2] + shift for p in projects]
-                zorder = np.mean([p[2] for p in projects])
-                ax.add_artist(Polygon(xys, ec="none", fc=self.plasticcolor))
-                for j in xrange(self.N):
-                    for k in xrange(self.N):
-                        corners = self._stickerpolygon(xdir, ydir, zdir, csz, j, k)
-                        projects = self._render_points(corners, viewpoint)
-                        xys = [p[0:2] + shift for p in projects]
-                        ax.add_artist(Polygon(xys, ec="none", fc=self.stickercolors[self.stickers[i, j, k]]))
-                x0, y0, zorder = self._render_points([1.5 * self.normals[i], ], viewpoint)[0]
-                ax.text(x0 + shift[0], y0 + shift[1], f, color=self.labelcolor,
+            plastic = self._render_points(corners, viewpoint)
+            ind = visible_order(plastic[:, :, 0:2], -plastic[:, :, 2].mean(1), clockwise=False)
+            # each visible face's plastic (padded to nv vertices) followed by its stickers
+            xys = np.empty((len(ind), 1 + self.N * self.N, nv, 2))
+            xys[:, 0, :4] = plastic[ind, :, 0:2]
+            xys[:, 0, 4:] = plastic[ind, 3:, 0:2]
+            xys[:, 1:] = self._render_points(stickers[ind], viewpoint)[..., 0:2]
+            xys += shift
+            fcs = np.empty((len(ind), 1 + self.N * self.N, 4))
+            fcs[:, 0] = plasticcolor
+            fcs[:, 1:] = colors[ind]
+            pc = PolyCollection(xys.reshape(-1, nv, 2), facecolors=fcs.reshape(-1, 4), edgecolors="none")
+            pc._sticker_index = self._sticker_index(ind, plastic=True)
+            ax.add_collection(pc, autolim=False)
+            for i in ind:
+                x0, y0, zorder = self._render_points(1.5 * self.normals[i], viewpoint)
+                ax.text(x0 + shift[0], y0 + shift[1], self.dictface[i], color=self.labelcolor,
                         ha="center", va="center", rotation=20, fontsize=self.fontsize / (-zorder))
         return None
 
-    def _stickerpolygon(self, xdir, ydir, zdir, csz, j, k):
+    def _stickerpolygons(self, xdirs, ydirs, zdirs, csz):
+        """
+        Internal function for the `render()` function.  Corners of the
+        (octagonal) sticker polygons of the faces with the given unit
+        vectors (shape (F, 3) each), as an array of shape (F, N, N, 8, 3).
+        """
         small = 0.5 * (1. - self.stickerwidth)
         large = 1. - small
-        return [zdir - xdir + (j + small) * csz * xdir - ydir + (k + small + small) * csz * ydir,
-                zdir - xdir + (j + small + small) * csz * xdir - ydir + (k + small) * csz * ydir,
-                zdir - xdir + (j + large - small) * csz * xdir - ydir + (k + small) * csz * ydir,
-                zdir - xdir + (j + large) * csz * xdir - ydir + (k + small + small) * csz * ydir,
-                zdir - xdir + (j + large) * csz * xdir - ydir + (k + large - small) * csz * ydir,
-                zdir - xdir + (j + large - small) * csz * xdir - ydir + (k + large) * csz * ydir,
-                zdir - xdir + (j + small + small) * csz * xdir - ydir + (k + large) * csz * ydir,
-                zdir - xdir + (j + small) * csz * xdir - ydir + (k + large - small) * csz * ydir]
+        u = np.array([small, small + small, large - small, large,
+                      large, large - small, small + small, small])
+        v = np.array([small + small, small, small, small + small,
+                      large - small, large, large, large - small])
+        ls = np.arange(self.N)
+        us = (ls[:, None] + u) * csz # (N, 8)
+        vs = (ls[:, None] + v) * csz
+        return ((zdirs - xdirs - ydirs)[:, None, None, None, :]
+                + us[None, :, None, :, None] * xdirs[:, None, None, None, :]
+                + vs[None, None, :, :, None] * ydirs[:, None, None, None, :])
 
     def render_flat(self, ax):
         """
@@ -249,21 +422,54 @@ class Cube(object):
         function.  This is a map, not a view really.  It does not
         properly render the plastic and stickers.
         """
+        cs = 1. / self.N
+        square = cs * np.array([[0., 0.], [1., 0.], [1., 1.], [0., 1.]])
+        jk = cs * np.indices((self.N, self.N)).transpose(1, 2, 0) # (N, N, 2)
+        xys = (np.array(self.pltpos)[:, None, None, None, :]
+               + jk[None, :, :, None, :] + square)
+        colors = to_rgba_array(self.stickercolors)[self.stickers]
+        pc = PolyCollection(xys.reshape(-1, 4, 2), facecolors=colors.reshape(-1, 4),
+                            edgecolors=self.plasticcolor)
+        pc._sticker_index = self._sticker_index(np.arange(6))
+        ax.add_collection(pc, autolim=False)
         for f, i in self.facedict.items():
             x0, y0 = self.pltpos[i]
-            cs = 1. / self.N
-            for j in xrange(self.N):
-                for k in xrange(self.N):
-                    ax.add_artist(Rectangle((x0 + j * cs, y0 + k * cs), cs, cs, ec=self.plasticcolor,
-                                            fc=self.stickercolors[self.stickers[i, j, k]]))
             ax.text(x0 + 0.5, y0 + 0.5, f, color=self.labelcolor,
                     ha="center", va="center", rotation=20, fontsize=self.fontsize)
         return None
 
-    def render(self, flat=True, views=True):
+    def _sticker_index(self, faces, plastic=False):
+        """
+        Internal function for the `render()` function.  Flat indices into
+        `self.stickers` of the polygons drawn for `faces`, in drawing
+        order, with -1 for the plastic polygon that precedes each face's
+        stickers if `plastic`.
+        """
+        ind = np.arange(6 * self.N * self.N).reshape(6, -1)[faces]
+        if plastic:
+            ind = np.hstack([-np.ones((len(faces), 1), dtype=int), ind])
+        return ind.ravel()
+
+    def recolor(self, fig):
+        """
+        Update the sticker colors of a figure made by `render()` to the
+        current state of the cube, without building any new artists.
+        """
+        colors = np.vstack([to_rgba_array(self.stickercolors)[self.stickers.ravel()],
+                            to_rgba_array(self.plasticcolor)])
+        for ax in fig.axes:
+            for pc in ax.collections:
+                ind = getattr(pc, "_sticker_index", None)
+                if ind is not None:
+                    pc.set_facecolor(colors[ind])
+        return None
+
+    def render(self, flat=True, views=True, fig=None):
         """
         Visualize the cube in a standard layout, including a flat,
-        unwrapped view and three perspective views.
+        unwrapped view and three perspective views.  Draws into a new
+        pyplot figure, or into `fig` (for instance a bare
+        `matplotlib.figure.Figure`) if given.
         """
         assert flat or views
         xlim = (-2.4, 3.4)
@@ -273,7 +479,11 @@ class Cube(object):
         if not views:
             xlim = (-1.2, 3.2)
             ylim = (-1.2, 2.2)
-        fig = plt.figure(figsize=((xlim[1] - xlim[0]) * self.N / 5., (ylim[1] - ylim[0]) * self.N / 5.))
+        figsize = ((xlim[1] - xlim[0]) * self.N / 5., (ylim[1] - ylim[0]) * self.N / 5.)
+        if fig is None:
+            fig = plt.figure(figsize=figsize)
+        else:
+            fig.set_size_inches(figsize)
         ax = fig.add_axes((0, 0, 1, 1), frameon=False,
                           xticks=[], yticks=[])
         if views:
@@ -284,11 +494,109 @@ class Cube(object):
         ax.set_ylim(ylim)
         return fig
 
+def _render_chunk(args):
+    """
+    Worker for `render_frames()`: render frames `start` to `stop - 1`
+    into one reused figure, from `cube` in the state of frame `start`
+    and the moves between the frames.  Returns the frame size and, if
+    wanted, the raw RGBA bytes of every frame.
+    """
+    cube, moves, start, stop, pattern, pixels, dpi, flat, views = args
+    fig = cube.render(flat=flat, views=views, fig=Figure())
+    if dpi is not None:
+        fig.set_dpi(dpi)
+    canvas = FigureCanvasAgg(fig)
+    frames = []
+    for m in xrange(start, stop):
+        if m > start:
+            cube.move(*moves[m - start - 1])
+            cube.recolor(fig)
+        canvas.draw()
+        if pattern is not None:
+            fig.savefig(pattern % m, dpi=fig.dpi)
+        if pixels:
+            frames.append(str(canvas.buffer_rgba()))
+    return canvas.get_width_height(), frames
+
+def render_frames(cube, moves, pattern=None, movie=None, fps=10, dpi=None,
+                  flat=False, views=True, processes=None, chunksize=16):
+    """
+    Render the frame sequence of `moves` (a list of `(f, l, d)`
+    arguments to `Cube.move()`) applied to `cube`: frame `m` shows the
+    cube after the first `m` moves, so there are `len(moves) + 1`
+    frames.  `cube` itself is not changed.
+
+    - write frame `m` as a PNG file named `pattern % m` if `pattern` is given.
+    - stream the frames into ffmpeg, writing the animation `movie` (eg,
+      "moves.gif" or "moves.mp4") at `fps` frames per second, if given.
+
+    The frames are split into chunks of `chunksize` that are rendered
+    and encoded by a pool of `processes` workers (default: one per
+    core).  Each worker builds one figure per chunk and only recolors
+    it from frame to frame, and at most two chunks per worker are in
+    flight at a time, so memory use does not grow with `len(moves)`.
+    The moves are applied once, in this process, which sends each chunk
+    the cube as of its first frame and only the moves of the chunk.
+    """
+    assert pattern is not None or movie is not None
+    nframes = len(moves) + 1
+
+    def chunks():
+        # Each chunk gets a copy of the cube in the state of its first
+        # frame, reached in one pass over the moves, and its own moves.
+        state = copy.deepcopy(cube)
+        state.verbose = False
+        for start in xrange(0, nframes, chunksize):
+            stop = min(start + chunksize, nframes)
+            yield (copy.deepcopy(state), moves[start:stop - 1], start, stop,
+                   pattern, movie is not None, dpi, flat, views)
+            for f, l, d in moves[start:stop]:
+                state.move(f, l, d)
+
+    tasks = chunks()
+    pool = None
+    if processes != 1:
+        pool = multiprocessing.Pool(processes)
+        processes = pool._processes
+    writer = None
+    try:
+        if pool is None:
+            results = it.imap(_render_chunk, tasks)
+        else:
+            results = _bounded_imap(pool, _render_chunk, tasks, 2 * processes)
+        for (width, height), frames in results:
+            if movie is not None and writer is None:
+                writer = subprocess.Popen([matplotlib.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+                                           "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "%dx%d" % (width, height),
+                                           "-r", str(fps), "-i", "-", movie], stdin=subprocess.PIPE)
+            for frame in frames:
+                writer.stdin.write(frame)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if writer is not None:
+            writer.stdin.close()
+            writer.wait()
+    return None
+
+def _bounded_imap(pool, func, iterable, size):
+    """
+    Ordered `pool.imap()` that keeps at most `size` tasks in flight.
+    """
+    pending = []
+    for args in iterable:
+        pending.append(pool.apply_async(func, (args, )))
+        if len(pending) >= size:
+            yield pending.pop(0).get()
+    while pending:
+        yield pending.pop(0).get()
+
 def adjacent_edge_flip(cube):
     """
     Do a standard edge-flipping algorithm.  Used for testing.
     """
-    ls = xrange(cube.N)[1:-1]
+    ls = range(cube.N)[1:-1]
     cube.move("R", 0, -1)
     for l in ls:
         cube.move("U", l, 1)
@@ -327,7 +635,7 @@ def checkerboard(cube):
     """
     Dumbness.
     """
-    ls = xrange(cube.N)[::2]
+    ls = range(cube.N)[::2]
     for f in ["U", "F", "R"]:
         for l in ls:
             cube.move(f, l, 2)
@@ -348,6 +656,4 @@ if __name__ == "__main__":
 #    c.move("U", 0, 1)
 #    swap_off_diagonal(c, "R", 3, 2)
 #    checkerboard(c)
-    for m in xrange(32):
-        c.render(flat=False).savefig("test%02d.png" % m, dpi=865 / c.N)
-        c.randomize(1)
+    render_frames(c, c.random_moves(31), pattern="test%02d.png", dpi=865 / c.N)
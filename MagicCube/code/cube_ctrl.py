@@ -21,6 +21,8 @@ class CubeLedStripContoller(ledstripctrl.LedStripContoller):
 
     def __init__(self, serial_stream, led_to_sticker_mapping, face_colors, debug=False):
         self.debug = debug
+        # Optional session.SessionRecorder that logs the LED frames.
+        self.recorder = None
         self.led_to_sticker_mapping = led_to_sticker_mapping
         self.led_count = max(led_to_sticker_mapping.iterkeys()) + 1
         print 'LED count is ' + repr(self.led_count)
@@ -30,12 +32,22 @@ class CubeLedStripContoller(ledstripctrl.LedStripContoller):
     def send_cube_state(self, sticker_color_id):
         # Light each LED with the color of the corresponding sticker.
         print ' '.join(repr(y) for y in sticker_color_id)
+        colors = [CubeLedStripContoller.COLOR_OFF[1:]] * self.led_count
         for led, sticker_id in self.led_to_sticker_mapping.iteritems():
             color = self.face_colors[sticker_color_id[sticker_id]] if sticker_id >= 0 else CubeLedStripContoller.COLOR_OFF
             if self.debug >= 1:
                 print 'LED %d, sticker %d, color %s' % (led, sticker_id, color)
             self._led_set(led, color)
             self._show()
+            colors[led] = color.lstrip('#')
+        if self.recorder:
+            self.recorder.led(colors)
+
+    def send_led_frame(self, colors):
+        # Light LED i with the hex color colors[i], e.g. a frame of a recorded session.
+        for led, color in enumerate(colors):
+            self._led_set(led, color)
+        self._show()
 
 def load_led_to_sticker_mapping(data):
     # Load a comma-separated file with LED#,sticker# data. -1 sticker# indicates that the light
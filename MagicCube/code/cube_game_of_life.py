@@ -2,12 +2,13 @@
 # Adapted from cube code written by David Hogg
 #   https://github.com/davidwhogg/MagicCube
 
-import numpy as np, matplotlib.pyplot as plt, sys, networkx as nx, random, colorsys
+import numpy as np, matplotlib.pyplot as plt, sys, random, colorsys
 from matplotlib import widgets
 # from MagicCube.code.projection import Quaternion, project_points
 from projection import Quaternion, project_points
 from cube_interactive import Cube
-from game_of_life import GameOfLife
+from game_of_life import SparseGameOfLife, CycleDetector, RestartPolicy
+from csr_graph import load_graph
 from collections import Counter
 
 def wheel(wheel_pos):
@@ -62,10 +63,14 @@ class GameOfLifeGui(plt.Axes):
                  max_ticks=100,
                  simulation_interval_msecs=500,
                  callback=None,
+                 restart_policy=None,
                  **kwargs):
         # Game of Life simulation controls.
         self.t = 0
         self._max_ticks = max_ticks
+        # Restart on extinction, after max_ticks, or once a cycle has repeated.
+        self._restart_policy = restart_policy or RestartPolicy(max_ticks=max_ticks)
+        self._detector = CycleDetector()
         self._simulation_interval_msecs = simulation_interval_msecs
         self._init_simulation()
 
@@ -181,7 +186,8 @@ class GameOfLifeGui(plt.Axes):
         sticker_centroids = self._project(self.cube._sticker_centroids[:, :3])
 
         plastic_color = self.cube.plastic_color       
-        colors = np.array([cell_color(self._game.live[u] if u in self._game.live else 0) for u in self._game.g.nodes()])
+        live = self._game.live
+        colors = np.array([cell_color(live[u] if u in live else 0) for u in self._game.g.nodes()])
         #colors = np.array([cell_color(self._random_index[self._game.live[u]] if u in self._game.live else 0) for u in self._game.g.nodes()])
         # colors = np.array([cell_color(self.t, max_age=160) for u in xrange(54)])
         # colors = np.array(generate_colors(54))
@@ -316,18 +322,23 @@ class GameOfLifeGui(plt.Axes):
         initial_population_size = random.randint(int(0.1 * g.number_of_nodes()), g.number_of_nodes())
         print 'Initial population size', initial_population_size
         initial_population = random.sample(g.nodes(), initial_population_size)
-        self._game = GameOfLife(g, initial_population)
+        self._game = SparseGameOfLife(g, initial_population)
+        self._detector.reset()
+        self._detector.update(self._game.key())
         self._tick = -1
         self._random_index = range(1, 384)
         random.shuffle(self._random_index)
 
     def _run_simulation(self, *args):
-        # Restart simulation on extinction or after the max # of timesteps has been reached.
-        # TODO(livne): restart when a cycle of a sufficiently small size is detected and repeated enough times.
-        if self._tick == self._max_ticks or not self._game.live:
+        # Restart simulation on extinction, after the max # of timesteps has been reached, or when
+        # a cycle of a sufficiently small size is detected and repeated enough times.
+        reason = self._restart_policy.reason(self._game, self._detector)
+        if reason:
+            print 'Restart:', reason, 'period', self._detector.period, 'transient', self._detector.transient
             self._init_simulation()
         else:
             self._game.tick()
+            self._detector.update(self._game.key())
         self._tick += 1
 #        print 'Tick', self._tick, 'live cells', ' '.join(map(str, sorted(self._game.live.iteritems())))
         print 'Tick', self._tick, 'population', len(self._game.live), 'population age', Counter(self._game.live.itervalues())
@@ -336,9 +347,9 @@ class GameOfLifeGui(plt.Axes):
 
 if __name__ == '__main__':
     if len(sys.argv) != 2:
-        print 'Usage: cube_game_of_life.py <neighbors-graph-pickle-file>'
+        print 'Usage: cube_game_of_life.py <neighbors-graph-file>'
         sys.exit(1)
-    g = nx.read_gpickle(sys.argv[1])
+    g = load_graph(sys.argv[1])
     face_colors = ["white", "yellow",
                  "blue", "green",
                  "purple", "red",
@@ -3,11 +3,15 @@
 # Adapted from cube code written by David Hogg
 #   https://github.com/davidwhogg/MagicCube
 
+import os, time
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import widgets
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba_array
 # from MagicCube.code.projection import Quaternion, project_points
-from projection import Quaternion, project_points
+from projection import Quaternion, project_points, quarter_turn_matrix, visible_order
+import zobrist
 
 """
 Sticker representation
@@ -41,7 +45,6 @@ The canonical order is found by doing
 After any rotation, this can be used to quickly restore the cube to
 canonical position.
 """
-import itertools as it
 
 class Cube:
     """Magic Cube Representation"""
@@ -77,6 +80,13 @@ class Cube:
             for theta in (np.pi / 2, -np.pi / 2)]
     rots += [Quaternion.from_v_theta(y, theta)
              for theta in (np.pi / 2, -np.pi / 2, np.pi, 2 * np.pi)]
+    # The same rotations as exact integer matrices
+    rot_matrices = np.array([quarter_turn_matrix(x, n) for n in (1, -1)] +
+                            [quarter_turn_matrix(y, n) for n in (1, -1, 2, 4)])
+
+    # Base geometry per N (see base_geometry), optionally cached on disk
+    _geometry = {}
+    cache_dir = None
 
     # define face movements
     facesdict = dict(F=z, B= -z,
@@ -98,66 +108,94 @@ class Cube:
         self._initialize_arrays()
 
     def _initialize_arrays(self):
-        # initialize centroids, faces, and stickers.  We start with a
-        # base for each one, and then translate & rotate them into position.
-
-        # Define N^2 translations for each face of the cube
-        cubie_width = 2. / self.N
-        translations = np.array([[[-1 + (i + 0.5) * cubie_width,
-                                   - 1 + (j + 0.5) * cubie_width, 0]]
-                                 for i in xrange(self.N)
-                                 for j in xrange(self.N)])
-
-        # Create arrays for centroids, faces, stickers, and colors
-        face_centroids = []
-        faces = []
-        sticker_centroids = []
-        stickers = []
-        colors = []
-
-        factor = np.array([1. / self.N, 1. / self.N, 1])
-
-        for i in xrange(6):
-            M = self.rots[i].as_rotation_matrix()
-            faces_t = np.dot(factor * self.base_face
-                             + translations, M.T)
-            stickers_t = np.dot(factor * self.base_sticker
-                                + translations, M.T)
-            face_centroids_t = np.dot(self.base_face_centroid
-                                      + translations, M.T)
-            sticker_centroids_t = np.dot(self.base_sticker_centroid
-                                         + translations, M.T)
-            colors_i = i + np.zeros(face_centroids_t.shape[0], dtype=int)
-
-            # append face ID to the face centroids for lex-sorting
-            face_centroids_t = np.hstack([face_centroids_t.reshape(-1, 3),
-                                          colors_i[:, None]])
-            sticker_centroids_t = sticker_centroids_t.reshape((-1, 3))
-
-            faces.append(faces_t)
-            face_centroids.append(face_centroids_t)
-            stickers.append(stickers_t)
-            sticker_centroids.append(sticker_centroids_t)
-            colors.append(colors_i)
-
-        self._face_centroids = np.vstack(face_centroids)
-        self._faces = np.vstack(faces)
-        self._sticker_centroids = np.vstack(sticker_centroids)
-        self._stickers = np.vstack(stickers)
-        self._colors = np.concatenate(colors)
-
-        self._sort_faces()
-        self._face_id = dict(it.izip((tuple(np.around(3 * x[:3]).astype(int)) for x in self._face_centroids),
-                                     xrange(6 * self.N * self.N)))
-
-    def _sort_faces(self):
-        # use lexsort on the centroids to put faces in a standard order.
-        ind = np.lexsort(self._face_centroids.T)
-        self._face_centroids = self._face_centroids[ind]
-        self._sticker_centroids = self._sticker_centroids[ind]
-        self._stickers = self._stickers[ind]
-        self._colors = self._colors[ind]
-        self._faces = self._faces[ind]
+        # Copy the base geometry of an NxNxN cube (shared by all cubes of
+        # that size) into the arrays that rotate_face modifies in place.
+        geometry = self.base_geometry(self.N)
+        self._face_centroids = geometry['face_centroids'].copy()
+        self._faces = geometry['faces'].copy()
+        self._sticker_centroids = geometry['sticker_centroids'].copy()
+        self._stickers = geometry['stickers'].copy()
+        self._colors = geometry['colors'].copy()
+        self._lattice_keys = geometry['lattice_keys']
+        self._lattice_index = geometry['lattice_index']
+        self._lod = None
+        self._zobrist = None
+
+    @classmethod
+    def base_geometry(cls, N):
+        """Centroids, faces, stickers, colors and sticker lookup table of a
+        solved NxNxN cube, in canonical order.
+
+        The arrays are computed once per N and kept (read-only) in
+        cls._geometry; if cls.cache_dir is set, they are also saved to and
+        loaded from a .npz file there.
+        """
+        if N not in cls._geometry:
+            file_name = None
+            if cls.cache_dir is not None:
+                file_name = os.path.join(cls.cache_dir, 'cube_geometry_%d.npz' % N)
+            if file_name is not None and os.path.exists(file_name):
+                data = np.load(file_name)
+                geometry = dict((key, data[key]) for key in data.files)
+            else:
+                geometry = cls._compute_geometry(N)
+                if file_name is not None:
+                    np.savez(file_name, **geometry)
+            for array in geometry.itervalues():
+                array.flags.writeable = False
+            cls._geometry[N] = geometry
+        return cls._geometry[N]
+
+    @classmethod
+    def _compute_geometry(cls, N):
+        # Start with a base for each of centroids, faces and stickers, then
+        # translate them into the N^2 positions on a face and rotate them
+        # onto the six sides, all at once.
+        cubie_width = 2. / N
+        centers = -1 + (np.arange(N) + 0.5) * cubie_width
+        translations = np.zeros((N * N, 1, 3))
+        translations[:, 0, 0] = np.repeat(centers, N)
+        translations[:, 0, 1] = np.tile(centers, N)
+
+        factor = np.array([1. / N, 1. / N, 1])
+        M = cls.rot_matrices.astype(float)
+
+        def place(base, rotations):
+            # (6 * N^2, len(base), 3) points of the base on all sides.
+            points = np.dot(base + translations, rotations.transpose(0, 2, 1))
+            return points.transpose(2, 0, 1, 3).reshape(-1, len(base), 3)
+
+        faces = place(factor * cls.base_face, M)
+        stickers = place(factor * cls.base_sticker, M)
+        face_centroids = place(cls.base_face_centroid, M)[:, 0]
+        sticker_centroids = place(cls.base_sticker_centroid, M)[:, 0]
+        colors = np.repeat(np.arange(6), N * N)
+
+        # The standard sticker order (used by the LED mapping and neighbor
+        # graph files) follows the round-off of the floating-point face
+        # rotations, so sort on centroids rotated that way.  Append the face
+        # ID to the centroids for lex-sorting.
+        R = np.array([rot.as_rotation_matrix() for rot in cls.rots])
+        order_keys = np.hstack([place(cls.base_face_centroid, R)[:, 0], colors[:, None]])
+        ind = np.lexsort(order_keys.T)
+
+        face_centroids = np.hstack([face_centroids, colors[:, None]])[ind]
+        # Stickers on the lattice are looked up by their integer centroid
+        # coordinates N * centroid, packed into one sorted key.
+        lattice_keys = cls._lattice_key(face_centroids[:, :3], N)
+        lattice_index = np.argsort(lattice_keys)
+        return dict(face_centroids=face_centroids,
+                    faces=faces[ind],
+                    sticker_centroids=sticker_centroids[ind],
+                    stickers=stickers[ind],
+                    colors=colors[ind],
+                    lattice_keys=lattice_keys[lattice_index],
+                    lattice_index=lattice_index)
+
+    @staticmethod
+    def _lattice_key(centroids, N):
+        k = np.rint(N * centroids).astype(int) + N
+        return (k[:, 0] * (2 * N + 1) + k[:, 1]) * (2 * N + 1) + k[:, 2]
 
     def rotate_face(self, f, n=1, layer=0):
         """Rotate Face"""
@@ -181,38 +219,200 @@ class Cube:
             self._move_list.append((f, n, layer))
         
         v = self.facesdict[f]
-        r = Quaternion.from_v_theta(v, n * np.pi / 2)
-        M = r.as_rotation_matrix()
+        if n == int(n):
+            # whole quarter turns: use the cached exact matrix
+            M = quarter_turn_matrix(v, int(n))
+        else:
+            M = Quaternion.from_v_theta(v, n * np.pi / 2).as_rotation_matrix()
 
+        # Layer of each sticker along v: the face itself and the sticker
+        # centers of the first row are in layer 0, and so on.
         proj = np.dot(self._face_centroids[:, :3], v)
         cubie_width = 2. / self.N
-        flag = ((proj > 0.9 - (layer + 1) * cubie_width) & 
-                (proj < 1.1 - layer * cubie_width))
+        flag = np.clip(np.floor((1 - proj) / cubie_width), 0, self.N - 1) == layer
+
+        if self._zobrist is not None:
+            moved = np.nonzero(flag & self._on_lattice)[0]
+            self._zobrist ^= zobrist.hash_values(self._positions[moved], self._colors[moved])
 
         for y in [self._stickers, self._sticker_centroids, self._faces]:
             y[flag] = np.dot(y[flag], M.T)
         self._face_centroids[flag, :3] = np.dot(self._face_centroids[flag, :3],
                                                 M.T)
-        print self._face_centroids[:5, :]
+        self._lod = None
+
+        if self._zobrist is not None:
+            # Stickers in the middle of a turn leave the hash until they
+            # land on the lattice again.
+            moved = np.nonzero(flag)[0]
+            self._locate(moved)
+            moved = moved[self._on_lattice[moved]]
+            self._zobrist ^= zobrist.hash_values(self._positions[moved], self._colors[moved])
+
+    @property
+    def zobrist(self):
+        """Zobrist hash of the color_id() state, as a 64-bit integer. Kept up
+        to date by rotate_face; stickers in the middle of a partial turn do
+        not count."""
+        if self._zobrist is None:
+            everything = np.arange(len(self._colors))
+            self._positions = np.zeros(len(everything), dtype=int)
+            self._on_lattice = np.zeros(len(everything), dtype=bool)
+            self._locate(everything)
+            self._zobrist = zobrist.hash_values(self._positions[self._on_lattice],
+                                                self._colors[self._on_lattice])
+        return int(self._zobrist)
+
+    def _locate(self, stickers):
+        # Update the color_id() positions of the given stickers, and whether
+        # they are at a lattice position at all.
+        scaled = self.N * self._face_centroids[stickers, :3]
+        keys = self._lattice_key(self._face_centroids[stickers, :3], self.N)
+        i = np.minimum(np.searchsorted(self._lattice_keys, keys), len(self._lattice_keys) - 1)
+        self._on_lattice[stickers] = ((self._lattice_keys[i] == keys) &
+                                      np.all(abs(scaled - np.rint(scaled)) < 1e-6, axis=1))
+        self._positions[stickers] = self._lattice_index[i]
+
+    def lod_polygons(self):
+        """Level-of-detail geometry
+
+        Stickers at rest on the lattice are merged into rectangles of
+        same-colored stickers (rows of equal color runs, then equal runs
+        of consecutive rows), each drawn as one face and one sticker
+        polygon.  Stickers that are off the lattice, i.e. in the middle of
+        a face turn, are returned individually.
+
+        Returns
+        -------
+        faces, stickers, centroids, colors : ndarrays
+            shapes (M, 5, 3), (M, 9, 3), (M, 3) and (M,), in the format of
+            _faces, _stickers, _face_centroids[:, :3] and _colors.  The
+            result is cached until the next rotate_face.
+        """
+        if self._lod is None:
+            self._lod = self._merge_stickers()
+        return self._lod
+
+    def _merge_stickers(self):
+        N = self.N
+        w = 2. / N
+        c = self._face_centroids[:, :3]
+
+        # Lattice position of each sticker: the axis k of its face, the side
+        # s of the face along k, and the cell (iu, iv) on the face, where the
+        # in-plane axes (u, v) are ordered so that e_u x e_v = s e_k.
+        k = np.argmax(abs(c), axis=1)
+        s = np.sign(c[np.arange(len(c)), k])
+        u = np.where(s > 0, (k + 1) % 3, (k + 2) % 3)
+        v = 3 - k - u
+        grid = (c + 1) / w - 0.5
+        iu = np.rint(grid[np.arange(len(c)), u]).astype(int)
+        iv = np.rint(grid[np.arange(len(c)), v]).astype(int)
+        rest = ((abs(abs(c[np.arange(len(c)), k]) - 1) < 1e-6) &
+                (abs(grid[np.arange(len(c)), u] - iu) < 1e-6) &
+                (abs(grid[np.arange(len(c)), v] - iv) < 1e-6))
+        plane = 2 * k + (s > 0)
+
+        # Color of each lattice cell, -1 where the sticker is in motion.
+        cells = -np.ones((6, N, N), dtype=int)
+        cells[plane[rest], iu[rest], iv[rest]] = self._colors[rest]
+
+        # Runs of equal color along v.
+        start = np.ones((6, N, N), dtype=bool)
+        start[:, :, 1:] = cells[:, :, 1:] != cells[:, :, :-1]
+        first = np.nonzero(start.ravel())[0]
+        last = np.append(first[1:], cells.size) - 1
+        run_p, run_u, run_v0 = np.unravel_index(first, cells.shape)
+        run_v1 = last % N
+        run_c = cells.ravel()[first]
+        keep = run_c >= 0
+        run_p, run_u, run_v0, run_v1, run_c = (x[keep] for x in
+                                              (run_p, run_u, run_v0, run_v1, run_c))
+
+        # Merge identical runs of consecutive rows into rectangles.
+        ind = np.lexsort((run_u, run_c, run_v1, run_v0, run_p))
+        run_p, run_u, run_v0, run_v1, run_c = (x[ind] for x in
+                                              (run_p, run_u, run_v0, run_v1, run_c))
+        new = np.ones(len(ind), dtype=bool)
+        new[1:] = ((run_p[1:] != run_p[:-1]) | (run_v0[1:] != run_v0[:-1]) |
+                   (run_v1[1:] != run_v1[:-1]) | (run_c[1:] != run_c[:-1]) |
+                   (run_u[1:] != run_u[:-1] + 1))
+        first = np.nonzero(new)[0]
+        p, u0, v0, v1, color = (x[first] for x in
+                                (run_p, run_u, run_v0, run_v1, run_c))
+        u1 = np.append(run_u[first[1:] - 1], run_u[-1:]) if len(first) else u0
+
+        # Rectangle centers and half-widths in plane coordinates, and the
+        # basis (e_u, e_v, s e_k) of each of the six planes.
+        cu, hu = -1 + 0.5 * w * (u0 + u1 + 1), 0.5 * w * (u1 - u0 + 1)
+        cv, hv = -1 + 0.5 * w * (v0 + v1 + 1), 0.5 * w * (v1 - v0 + 1)
+        basis = np.zeros((6, 3, 3))
+        for q in xrange(6):
+            kq, sq = q // 2, 2 * (q % 2) - 1
+            uq = (kq + 1) % 3 if sq > 0 else (kq + 2) % 3
+            basis[q, 0, uq] = basis[q, 1, 3 - kq - uq] = 1
+            basis[q, 2, kq] = sq
+
+        def rectangles(base):
+            # Stretch the base polygon of one sticker over each rectangle,
+            # keeping its margins and corner cuts.
+            bx, by, bz = base.T
+            local = np.empty((len(p), len(base), 3))
+            local[:, :, 0] = cu[:, None] + np.sign(bx) * (hu[:, None] - (1 - abs(bx)) / N)
+            local[:, :, 1] = cv[:, None] + np.sign(by) * (hv[:, None] - (1 - abs(by)) / N)
+            local[:, :, 2] = bz
+            return np.einsum('mij,mjk->mik', local, basis[p])
+
+        centroids = np.einsum('mj,mjk->mk', np.vstack([cu, cv, np.ones_like(cu)]).T, basis[p])
+        moving = ~rest
+        return (np.concatenate([rectangles(self.base_face), self._faces[moving]]),
+                np.concatenate([rectangles(self.base_sticker), self._stickers[moving]]),
+                np.concatenate([centroids, c[moving]]),
+                np.concatenate([color, self._colors[moving]]))
+
+    def set_color_id(self, color_id):
+        # Put the cube in the state of the given color_id() array: solved
+        # geometry, recolored.  The move list starts over.
+        self._initialize_arrays()
+        self._colors = np.array(color_id, dtype=int)
+        self._move_list = []
 
     def color_id(self):
         # Return the color ID of each cube sticker, numbered 0..6*N^2-1.
+        keys = self._lattice_key(self._face_centroids[:, :3], self.N)
         color_id = np.zeros((6 * self.N * self.N,), dtype=int)
-        for y, color in it.izip(self._face_centroids, self._colors):
-            color_id[self._face_id[tuple(np.around(3 * y[:3]).astype(int))]] = color
+        color_id[self._lattice_index[np.searchsorted(self._lattice_keys, keys)]] = self._colors
         return color_id
 
 class InteractiveCube(plt.Axes):
     FACES = 'LRUDBF'
+    # Level of detail: when lod is None, same-colored stickers are merged
+    # (see Cube.lod_polygons) for cubes of at least lod_size layers, or when
+    # stickers are zoomed out below lod_pixels pixels across.
+    lod_size = 10
+    lod_pixels = 4.
     
     def __init__(self, cube=None,
                  interactive=True,
                  view=(0, 0, 10),
                  fig=None, rect=[0, 0.16, 1, 0.84],
                  callback=None,
+                 lod=None,
+                 solver=None,
                  **kwargs):
         # Optional call-back that receives the cube state whenever it is updated.
         self.callback = callback
+        # Optional session.SessionRecorder that logs moves, views and states.
+        # While the view is dragged, at most one view per VIEW_INTERVAL
+        # seconds is recorded; the final one is recorded on release.
+        self.recorder = None
+        self._view_time = 0.
+        self._view_pending = False
+        # Optional background_solver.BackgroundSolver that solves every state
+        # reached ahead of the "Solve Cube" button.
+        self.solver = solver
+        # True/False forces the merged/full geometry, None switches by size.
+        self.lod = lod
         if cube is None:
             self.cube = Cube(3)
         elif isinstance(cube, Cube):
@@ -264,8 +464,7 @@ class InteractiveCube(plt.Axes):
         self._digit_flags = np.zeros(10, dtype=bool)  # digits 0-9 pressed
 
         self._current_rot = self._start_rot  # current rotation state
-        self._face_polys = None
-        self._sticker_polys = None
+        self._polys = None
 
         self._draw_cube()
         self._execute_cube_callback()
@@ -315,56 +514,97 @@ class InteractiveCube(plt.Axes):
         return project_points(pts, self._current_rot, self._view, [0, 1, 0])
 
     def _execute_cube_callback(self):
-        if self.callback:
-            self.callback(self.cube.color_id())
-
-    def _draw_cube(self):                
-        stickers = self._project(self.cube._stickers)[:, :, :2]
-        faces = self._project(self.cube._faces)[:, :, :2]
-        face_centroids = self._project(self.cube._face_centroids[:, :3])
-        sticker_centroids = self._project(self.cube._sticker_centroids[:, :3])
-
-        plastic_color = self.cube.plastic_color
-        colors = np.asarray(self.cube.face_colors)[self.cube._colors]
-        face_zorders = -face_centroids[:, 2]
-        sticker_zorders = -sticker_centroids[:, 2]
-
-        if self._face_polys is None:
-            # initial call: create polygon objects and add to axes
-            self._face_polys = []
-            self._sticker_polys = []
-
-            for i in xrange(len(colors)):
-                fp = plt.Polygon(faces[i], facecolor=plastic_color,
-                                 zorder=face_zorders[i])
-                sp = plt.Polygon(stickers[i], facecolor=colors[i],
-                                 zorder=sticker_zorders[i])
-
-                self._face_polys.append(fp)
-                self._sticker_polys.append(sp)
-                self.add_patch(fp)
-                self.add_patch(sp)
-        else:
-            # subsequent call: update the polygon objects
-            for i in xrange(len(colors)):
-                self._face_polys[i].set_xy(faces[i])
-                self._face_polys[i].set_zorder(face_zorders[i])
-                self._face_polys[i].set_facecolor(plastic_color)
+        if self.callback or self.recorder:
+            color_id = self.cube.color_id()
+            if self.recorder:
+                self.recorder.state(color_id)
+            if self.callback:
+                self.callback(color_id)
 
-                self._sticker_polys[i].set_xy(stickers[i])
-                self._sticker_polys[i].set_zorder(sticker_zorders[i])
-                self._sticker_polys[i].set_facecolor(colors[i])
+    VIEW_INTERVAL = 0.1
+
+    def _record_view(self, force=True):
+        if not self.recorder:
+            return
+        now = time.time()
+        if force or now - self._view_time >= self.VIEW_INTERVAL:
+            self.recorder.view(self._current_rot)
+            self._view_time = now
+            self._view_pending = False
+        else:
+            self._view_pending = True
+
+    def _flush_view(self):
+        # Records the view if a throttled change has not been recorded yet.
+        if self._view_pending:
+            self._record_view()
+
+    def _use_lod(self):
+        if self.lod is not None:
+            return self.lod
+        if self.cube.N >= self.lod_size:
+            return True
+        # on-screen width of one sticker, in pixels
+        xlim = self.get_xlim()
+        pixels = self.bbox.width / abs(xlim[1] - xlim[0]) * 2. / self.cube.N
+        return pixels < self.lod_pixels
+
+    def _draw_cube(self):
+        if self._use_lod():
+            faces, stickers, face_centroids, sticker_colors = self.cube.lod_polygons()
+        else:
+            faces, stickers = self.cube._faces, self.cube._stickers
+            face_centroids = self.cube._face_centroids[:, :3]
+            sticker_colors = self.cube._colors
+        stickers = self._project(stickers)[:, :, :2]
+        faces = self._project(faces)[:, :, :2]
+        face_centroids = self._project(face_centroids)
+
+        # Keep only the faces turned towards the viewer, farthest first;
+        # each sticker is painted right after its face.
+        ind = visible_order(faces, face_centroids[:, 2])
+
+        # Pad the 5-point faces to the 9 points of the stickers (repeating
+        # the closing point) so faces and stickers interleave in one array.
+        verts = np.empty((len(ind), 2, stickers.shape[1], 2))
+        verts[:, 0, :faces.shape[1]] = faces[ind]
+        verts[:, 0, faces.shape[1]:] = faces[ind, -1:]
+        verts[:, 1] = stickers[ind]
+
+        face_rgba = to_rgba_array(self.cube.face_colors)
+        colors = np.empty((len(ind), 2, 4))
+        colors[:, 0] = to_rgba_array(self.cube.plastic_color)
+        colors[:, 1] = face_rgba[sticker_colors[ind]]
+        # Outline the faces in plastic color, so the culled back faces do
+        # not leave light seams between neighboring faces.
+        edgecolors = colors.copy()
+        edgecolors[:, 1] = 0.
+
+        if self._polys is None:
+            # initial call: create the collection and add to axes
+            self._polys = PolyCollection([], linewidths=0.5)
+            self.add_collection(self._polys, autolim=False)
+        self._polys.set_verts(verts.reshape(-1, stickers.shape[1], 2))
+        self._polys.set_facecolor(colors.reshape(-1, 4))
+        self._polys.set_edgecolor(edgecolors.reshape(-1, 4))
 
         self.figure.canvas.draw()
 
     def rotate(self, rot):
-        self._current_rot = self._current_rot * rot
+        # renormalize so round-off does not accumulate over many small rotations
+        self._current_rot = (self._current_rot * rot).normalized()
+        self._record_view(force=False)
 
     def rotate_face(self, face, turns=1, layer=0, steps=5, execute_call_back=True):
         if not np.allclose(turns, 0):
+            if self.recorder:
+                self._flush_view()
+                self.recorder.move(face, turns, layer)
             for _ in xrange(steps):
                 self.cube.rotate_face(face, turns * 1. / steps, layer=layer)
                 self._draw_cube()
+            if self.solver:
+                self.solver.submit(self.cube.zobrist, self.cube.color_id(), self.cube._move_list)
             if execute_call_back:
                 self._execute_cube_callback()
 
@@ -372,12 +612,19 @@ class InteractiveCube(plt.Axes):
         self.set_xlim(self._start_xlim)
         self.set_ylim(self._start_ylim)
         self._current_rot = self._start_rot
+        self._record_view()
         self._draw_cube()
 
     def _solve_cube(self, *args):
-        move_list = self.cube._move_list[:]
-        for (face, n, layer) in move_list[::-1]:
-            self.rotate_face(face, -n, layer, steps=3, execute_call_back=False)
+        # Use the background solver's moves if they are ready, else undo the
+        # move list.  The states passed on the way are not worth solving.
+        moves = self.solver.solution(self.cube.zobrist) if self.solver else None
+        if moves is None:
+            moves = [(face, -n, layer) for (face, n, layer) in self.cube._move_list[::-1]]
+        solver, self.solver = self.solver, None
+        for (face, n, layer) in moves:
+            self.rotate_face(face, n, layer, steps=3, execute_call_back=False)
+        self.solver = solver
         self.cube._move_list = []
         self._draw_cube()
         self._execute_cube_callback()
@@ -387,6 +634,7 @@ class InteractiveCube(plt.Axes):
         self.set_xlim(self._start_xlim)
         self.set_ylim(self._start_ylim)
         self._current_rot = self._start_rot
+        self._record_view()
 
         # Perform a sequence of random moves.
         layer = 0
@@ -467,6 +715,7 @@ class InteractiveCube(plt.Axes):
             self._button1 = False
         elif event.button == 3:
             self._button2 = False
+        self._flush_view()
 
     def _mouse_motion(self, event):
         """Handler for mouse motion"""
@@ -495,7 +744,8 @@ class InteractiveCube(plt.Axes):
                 self.set_xlim(factor * xlim[0], factor * xlim[1])
                 self.set_ylim(factor * ylim[0], factor * ylim[1])
 
-                self.figure.canvas.draw()
+                # redraw the cube, as zooming may switch the level of detail
+                self._draw_cube()
 
 def print_cube(sticker_color_id):
     print ' '.join(repr(y) for y in sticker_color_id)
@@ -607,7 +857,8 @@ class CubeStickerIdDiscoverer(object):
 
 if __name__ == '__main__':
     import sys
-    N = int(sys.argv[1]) if len(sys.argv) >= 2 else 3
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    N = int(args[0]) if args else 3
     face_colors = ["white", "yellow",
                  "blue", "green",
                  "purple", "red",
@@ -629,5 +880,9 @@ if __name__ == '__main__':
 
 #    plt.ion()
     fig = plt.figure(figsize=(7, 5))
-    fig.add_axes(InteractiveCube(c, callback=print_cube))
+    solver = None
+    if '--solver' in sys.argv:
+        from background_solver import BackgroundSolver
+        solver = BackgroundSolver(N)
+    fig.add_axes(InteractiveCube(c, callback=print_cube, solver=solver))
     plt.show()
@@ -0,0 +1,303 @@
+'''
+============================================================
+Disk-backed breadth-first search of cube state spaces.
+
+States are the places of a set of marker stickers (by default one
+sticker of every cubie the moves touch, which fixes the place and
+orientation of each piece), packed into one uint64 by the mixed-radix
+rank of each marker in its orbit. Moves are given in the notation of
+notation.py ("U R" = the <U, R> group), i.e. the rotate_face turns of
+cube_interactive, and their inverses are added; depths count moves
+of that list ("U U2 R R2" for the half-turn metric).
+
+Each layer of the search lives on disk as a run: a file of
+zlib-compressed chunks of sorted, delta-encoded keys. A layer is
+expanded a block at a time into sorted runs of successors of at most
+chunk_size keys each. The runs are merged fan_in at a time into longer
+runs until at most fan_in are left, and those are merged, deduplicated
+and stripped of the two previous layers in one last streaming pass
+(the moves are closed under inverse, so a successor of layer d is in
+layer d - 1, d or d + 1). A reader holds at most two chunks, so memory
+use is bounded by about 2 (fan_in + 2) chunk_size keys, whatever the
+layer size; stats records the peak resident size of the process.
+
+- bfs = ExternalBFS(3, 'U R', work_dir='/tmp/ur')
+- bfs.run() returns the number of states of each depth, with the I/O
+  statistics of each layer in bfs.stats.
+============================================================
+'''
+import os, resource, shutil, struct, tempfile, time, zlib
+import numpy as np
+from algorithms import CubeMoves
+from cube_interactive import Cube
+
+# Chunk header: compressed size, number of keys.
+_CHUNK = struct.Struct('<QQ')
+
+def _delta(chunk):
+    delta = chunk.copy()
+    delta[1:] -= chunk[:-1]
+    return delta
+
+class RunWriter(object):
+    '''Writes sorted uint64 keys to a run file, one compressed chunk per write().'''
+    def __init__(self, file_name):
+        self._file = open(file_name, 'wb')
+        self.bytes_written = 0
+
+    def write(self, keys):
+        data = zlib.compress(_delta(keys).tostring(), 1)
+        self._file.write(_CHUNK.pack(len(data), len(keys)))
+        self._file.write(data)
+        self.bytes_written += _CHUNK.size + len(data)
+
+    def close(self):
+        self._file.close()
+
+def write_run(file_name, keys, chunk_size=1 << 20):
+    '''Writes the sorted uint64 array keys to a run file. Returns the number of bytes
+    written.'''
+    writer = RunWriter(file_name)
+    for start in xrange(0, len(keys), chunk_size):
+        writer.write(keys[start:start + chunk_size])
+    writer.close()
+    return writer.bytes_written
+
+class RunReader(object):
+    '''Reads a run file chunk by chunk. buffer holds the keys read but not yet taken.'''
+    def __init__(self, file_name):
+        self._file = open(file_name, 'rb')
+        self.buffer = np.zeros(0, dtype=np.uint64)
+        self.bytes_read = 0
+        self.exhausted = False
+        self._load()
+
+    def _load(self):
+        # Appends the next chunk to the buffer; returns False at the end of the file.
+        header = self._file.read(_CHUNK.size)
+        if len(header) < _CHUNK.size:
+            self.exhausted = True
+            self._file.close()
+            return False
+        size, count = _CHUNK.unpack(header)
+        data = self._file.read(size)
+        self.bytes_read += _CHUNK.size + size
+        chunk = np.cumsum(np.frombuffer(zlib.decompress(data), dtype=np.uint64), dtype=np.uint64)
+        self.buffer = np.concatenate([self.buffer, chunk])
+        return True
+
+    def fill(self):
+        # Makes sure the buffer is not empty unless the run is exhausted.
+        while not len(self.buffer) and not self.exhausted:
+            self._load()
+
+    def take(self, bound):
+        '''Removes and returns the keys up to and including bound.'''
+        while not self.exhausted and (not len(self.buffer) or self.buffer[-1] <= bound):
+            self._load()
+        n = np.searchsorted(self.buffer, bound, side='right')
+        taken, self.buffer = self.buffer[:n], self.buffer[n:]
+        return taken
+
+    def chunks(self):
+        '''Yields the keys of the rest of the run, one chunk at a time.'''
+        while True:
+            self.fill()
+            if not len(self.buffer):
+                return
+            chunk, self.buffer = self.buffer, np.zeros(0, dtype=np.uint64)
+            yield chunk
+
+def merge_runs(readers, exclude=()):
+    '''Yields sorted blocks of the distinct keys of the runs of readers that are in none
+    of the runs of exclude, reading all of them in one pass.'''
+    readers = list(readers)
+    while True:
+        for r in readers:
+            r.fill()
+        readers = [r for r in readers if len(r.buffer)]
+        if not readers:
+            return
+        # No unread key of any run is below the smallest buffer end.
+        bound = min(r.buffer[-1] for r in readers)
+        block = np.unique(np.concatenate([r.take(bound) for r in readers]))
+        for r in exclude:
+            block = block[~np.in1d(block, r.take(bound), assume_unique=True)]
+        if len(block):
+            yield block
+
+class MarkerSpace(object):
+    '''States given by the places of marker stickers of an NxNxN cube under a set of
+    moves, packed into uint64 keys.'''
+    def __init__(self, N, moves, markers=None):
+        self.N = N
+        cube_moves = CubeMoves(N)
+        generators = [cube_moves.effect(token) for token in moves.split()]
+        generators += [cube_moves.inverse(g) for g in generators]
+        self.generators = generators
+        if markers is None:
+            markers = self.default_markers(N, generators)
+        self.markers = np.asarray(markers)
+        # The orbit of each marker, and where each move takes its places (a sticker at
+        # place p goes to inverse(g)[p]), in orbit numbers.
+        inverses = [cube_moves.inverse(g) for g in generators]
+        self.orbits = []
+        for m in self.markers:
+            orbit = set([m])
+            queue = [m]
+            for p in queue:
+                for g in inverses:
+                    if g[p] not in orbit:
+                        orbit.add(g[p])
+                        queue.append(g[p])
+            self.orbits.append(np.array(sorted(orbit)))
+        self.radix = np.array([len(o) for o in self.orbits], dtype=np.uint64)
+        if np.sum(np.log2(self.radix.astype(float))) >= 64:
+            raise ValueError('%d markers do not fit in 64 bits' % len(self.markers))
+        self._place = np.cumprod(np.r_[np.uint64(1), self.radix[:-1]], dtype=np.uint64)
+        size = self.radix.max()
+        self._step = np.zeros((len(generators), len(self.markers), size), dtype=np.int64)
+        for i, g in enumerate(inverses):
+            for j, orbit in enumerate(self.orbits):
+                self._step[i, j, :len(orbit)] = np.searchsorted(orbit, g[orbit])
+        self.start = self.pack(np.array([[np.searchsorted(o, m) for o, m in zip(self.orbits, self.markers)]]))
+
+    @staticmethod
+    def default_markers(N, generators):
+        '''One sticker (the first) of every cubie that the generators move.'''
+        centroids = Cube.base_geometry(N)['face_centroids'][:, :3]
+        lattice = np.rint(N * centroids).astype(int)
+        axis = np.argmax(abs(lattice), axis=1)
+        rows = np.arange(len(lattice))
+        lattice[rows, axis] -= np.sign(lattice[rows, axis])
+        moved = np.zeros(len(lattice), dtype=bool)
+        for g in generators:
+            moved |= g != np.arange(len(g))
+        markers = {}
+        for p in np.nonzero(moved)[0]:
+            markers.setdefault(tuple(lattice[p]), p)
+        return sorted(markers.values())
+
+    def pack(self, ranks):
+        '''uint64 keys of a batch of orbit numbers, shape (B, markers).'''
+        return np.dot(ranks.astype(np.uint64), self._place).astype(np.uint64)
+
+    def unpack(self, keys):
+        '''Orbit numbers of the markers of a batch of keys.'''
+        ranks = np.empty((len(keys), len(self.markers)), dtype=np.int64)
+        keys = keys.copy()
+        for j, r in enumerate(self.radix):
+            ranks[:, j] = keys % r
+            keys //= r
+        return ranks
+
+    def successors(self, keys):
+        '''Sorted distinct keys of the states one move away from the states keys.'''
+        ranks = self.unpack(keys)
+        columns = np.arange(len(self.markers))
+        return np.unique(np.concatenate([self.pack(step[columns, ranks]) for step in self._step]))
+
+class ExternalBFS(object):
+    '''Breadth-first search of a MarkerSpace with the layers on disk in work_dir. Runs
+    hold chunks of chunk_size keys and at most fan_in runs are merged at a time.'''
+    def __init__(self, N, moves, markers=None, work_dir=None, chunk_size=1 << 20, fan_in=16, verbose=True):
+        self.space = MarkerSpace(N, moves, markers)
+        self.work_dir = work_dir
+        self.chunk_size = chunk_size
+        self.fan_in = max(2, fan_in)
+        self.verbose = verbose
+        self.counts = []
+        self.stats = []
+
+    def _layer(self, depth):
+        return os.path.join(self.work_dir, 'layer%03d.run' % depth)
+
+    def run(self, max_depth=None, keep_layers=False):
+        '''Runs the search to the end (or to max_depth) and returns the list of the
+        number of states at each depth. Layer files are deleted as soon as they are no
+        longer needed, unless keep_layers.'''
+        cleanup = self.work_dir is None
+        if cleanup:
+            self.work_dir = tempfile.mkdtemp(prefix='bfs')
+        elif not os.path.exists(self.work_dir):
+            os.makedirs(self.work_dir)
+        write_run(self._layer(0), self.space.start)
+        self.counts = [1]
+        depth = 0
+        try:
+            while self.counts[-1] and (max_depth is None or depth < max_depth):
+                self._expand(depth)
+                depth += 1
+                if not keep_layers and depth >= 2:
+                    os.remove(self._layer(depth - 2))
+        finally:
+            if cleanup:
+                shutil.rmtree(self.work_dir)
+                self.work_dir = None
+        if not self.counts[-1]:
+            self.counts.pop()
+        return self.counts
+
+    def _merge(self, runs, file_name, exclude=()):
+        # Merges the runs into the run file_name, without the keys of the runs exclude.
+        # Returns (keys, bytes read, bytes written).
+        readers = [RunReader(r) for r in runs]
+        exclude = [RunReader(r) for r in exclude]
+        count = 0
+        writer = RunWriter(file_name)
+        for block in merge_runs(readers, exclude):
+            for start in xrange(0, len(block), self.chunk_size):
+                writer.write(block[start:start + self.chunk_size])
+            count += len(block)
+        writer.close()
+        for r in runs:
+            os.remove(r)
+        return count, sum(r.bytes_read for r in readers + exclude), writer.bytes_written
+
+    def _expand(self, depth):
+        t = time.time()
+        read = written = 0
+        # Successors of the layer, a block at a time, as sorted runs of at most chunk_size keys.
+        runs = []
+        block = max(1, self.chunk_size // len(self.space.generators))
+        reader = RunReader(self._layer(depth))
+        for keys in reader.chunks():
+            for start in xrange(0, len(keys), block):
+                runs.append(os.path.join(self.work_dir, 'successors%03d.run' % len(runs)))
+                written += write_run(runs[-1], self.space.successors(keys[start:start + block]),
+                                     self.chunk_size)
+        read += reader.bytes_read
+        # Merge them fan_in at a time until few enough are left for the last pass.
+        passes = 0
+        while len(runs) > self.fan_in:
+            merged = []
+            for start in xrange(0, len(runs), self.fan_in):
+                merged.append(os.path.join(self.work_dir, 'merged%d_%03d.run' % (passes, len(merged))))
+                _, r, w = self._merge(runs[start:start + self.fan_in], merged[-1])
+                read, written = read + r, written + w
+            runs = merged
+            passes += 1
+        # The next layer, without the states of this and the previous layer.
+        exclude = [self._layer(d) for d in (depth - 1, depth) if d >= 0]
+        count, r, w = self._merge(runs, self._layer(depth + 1), exclude)
+        read, written = read + r, written + w
+        self.counts.append(count)
+        seconds = time.time() - t
+        # ru_maxrss is in kilobytes on Linux.
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.stats.append(dict(depth=depth + 1, states=count, merge_passes=passes + 1, bytes_read=read,
+                               bytes_written=written, peak_rss=peak_rss, seconds=seconds))
+        if self.verbose:
+            print 'depth %2d: %12d states, %d merge passes, %8.1f MB read, %8.1f MB written, %6.1f MB/s, peak RSS %6.1f MB' % (
+                depth + 1, count, passes + 1, read / 1e6, written / 1e6, (read + written) / 1e6 / max(seconds, 1e-6),
+                peak_rss / 1e6)
+
+if __name__ == '__main__':
+    import sys
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    moves = sys.argv[2] if len(sys.argv) > 2 else 'U R F'
+    bfs = ExternalBFS(N, moves, chunk_size=1 << 18)
+    t = time.time()
+    counts = bfs.run()
+    print '<%s> on %dx%dx%d: %d states, depth %d (%.1fs)' % (
+        ', '.join(moves.split()), N, N, N, sum(counts), len(counts) - 1, time.time() - t)
@@ -5,7 +5,11 @@ Created on Apr 22, 2015
 @author: Oren Livne <livne@uchicago.edu>
 ============================================================
 '''
-import sys, networkx as nx, itertools as it, random, time
+import sys, itertools as it, random, time
+from collections import Counter, deque
+import numpy as np
+import zobrist
+from csr_graph import CsrGraph, load_graph
 
 class GameOfLife(object):
   def __init__(self, g, live):
@@ -22,6 +26,13 @@ class GameOfLife(object):
     num_live_nbhrs = sum(1 for v in self.g.neighbors_iter(u) if v in self.live)
     return (num_live_nbhrs == 2 or num_live_nbhrs == 3) if u in self.live else (num_live_nbhrs == 3)
 
+  def key(self):
+    # Returns a hashable key of the set of live cells.
+    return frozenset(self.live)
+
+  def population(self):
+    return len(self.live)
+
   def tick(self):
     # Advances the state to the next time step (tick).
 
@@ -32,23 +43,245 @@ class GameOfLife(object):
                               ((v, 1) for u in self.live for v in self.g.neighbors_iter(u)
                                if v not in self.live and self.is_live_at_next_tick(v))))
 
+def sparse_rule(g, birth, survival):
+  # Returns the adjacency matrix of the CsrGraph g and the table of the next state of a cell by
+  # alive * stride + number of live neighbors, and stride.
+  max_degree = g.degrees().max() if g.number_of_nodes() else 0
+  if 0 in birth:
+    raise ValueError('Cells cannot be born without live neighbors')
+  adjacency = g.matrix(np.uint8 if max_degree < 128 else np.int32)
+  counts = np.arange(max_degree + 1)
+  return adjacency, np.concatenate([np.in1d(counts, birth), np.in1d(counts, survival)]), \
+    adjacency.dtype.type(max_degree + 1)
+
+class SparseGameOfLife(object):
+  def __init__(self, g, live, birth=(3,), survival=(2, 3)):
+    # Initializes a game of life on the graph g (a CsrGraph, or a networkx graph with nodes
+    # 0..n-1) starting with the live cells of the list live. A dead cell is born when its number
+    # of live neighbors is in birth, a live cell survives when it is in survival.
+    self.g = g if isinstance(g, CsrGraph) else CsrGraph.from_networkx(g)
+    self._adjacency, self._rule, self._stride = sparse_rule(self.g, birth, survival)
+    # ages = cell ages (0 = dead cell).
+    self.ages = np.zeros(self.g.number_of_nodes(), dtype=np.uint32)
+    self.ages[list(live)] = 1
+
+  @property
+  def live(self):
+    # Dictionary of live cell-location-to-cell-age, as in GameOfLife.
+    cells = np.flatnonzero(self.ages)
+    return dict(zip(cells.tolist(), self.ages[cells].astype(int).tolist()))
+
+  def key(self):
+    # Returns a hashable key of the set of live cells (the packed live bits).
+    return np.packbits(self.ages > 0).tostring()
+
+  def population(self):
+    return np.count_nonzero(self.ages)
+
+  def tick(self):
+    # Advances the state to the next time step (tick): one sparse matrix-vector product counts
+    # the live neighbors of all cells.
+    alive = (self.ages > 0).view(np.uint8)
+    num_live_nbhrs = self._adjacency.dot(alive)
+    alive = np.take(self._rule, num_live_nbhrs + alive * self._stride)
+    self.ages += 1
+    self.ages *= alive
+
+class CycleDetector(object):
+  def __init__(self, window=64):
+    # Detects when a game returns to one of its last window states. Only the keys of those
+    # states are kept, so cycles of period up to window are found, at their first repetition.
+    self.window = window
+    self.reset()
+
+  def reset(self):
+    # Forgets all states, for a new simulation.
+    self.t = -1
+    self._seen = {}
+    self._keys = deque()
+    # period = length of the cycle, transient = tick at which the game enters it (None until the
+    # first repetition).
+    self.period = None
+    self.transient = None
+
+  def update(self, key):
+    # Records the state key of the next tick (the initial state is tick 0). Returns the period
+    # of the cycle, or None if no state has repeated yet.
+    self.t += 1
+    if self.period is None:
+      t = self._seen.get(key)
+      if t is not None:
+        self.period, self.transient = self.t - t, t
+      else:
+        self._seen[key] = self.t
+        self._keys.append(key)
+        if len(self._keys) > self.window:
+          del self._seen[self._keys.popleft()]
+    return self.period
+
+  def repeats(self):
+    # Number of times the cycle has been traversed so far.
+    return 0 if self.period is None else (self.t - self.transient) // self.period
+
+class RestartPolicy(object):
+  def __init__(self, max_ticks=100, max_period=None, min_repeats=2):
+    # When to give up on a simulation: on extinction, after max_ticks ticks, or once it has run
+    # through a cycle of period at most max_period (any period if None) min_repeats times.
+    self.max_ticks = max_ticks
+    self.max_period = max_period
+    self.min_repeats = min_repeats
+
+  def reason(self, game, detector):
+    # Returns why the simulation of game, whose states have been fed to detector, should be
+    # restarted ('extinction', 'cycle' or 'max ticks'), or None to continue it.
+    if not game.population():
+      return 'extinction'
+    if detector.period is not None and (self.max_period is None or detector.period <= self.max_period) \
+      and detector.repeats() >= self.min_repeats:
+      return 'cycle'
+    if detector.t >= self.max_ticks:
+      return 'max ticks'
+    return None
+
+def simulate(game, policy=None, detector=None):
+  # Runs game until policy says to restart it. Returns (reason, ticks, period, transient).
+  policy = policy or RestartPolicy()
+  detector = detector or CycleDetector()
+  detector.reset()
+  detector.update(game.key())
+  while True:
+    reason = policy.reason(game, detector)
+    if reason:
+      return reason, detector.t, detector.period, detector.transient
+    game.tick()
+    detector.update(game.key())
+
+def random_populations(num_nodes, size):
+  # Returns a (size, num_nodes) bool array of random initial populations, each of a uniformly
+  # random size between 10% of the nodes and all of them, as in the main loop below.
+  sizes = np.random.randint(int(0.1 * num_nodes), num_nodes + 1, size=size)
+  ranks = np.argsort(np.argsort(np.random.rand(size, num_nodes), axis=1), axis=1)
+  return ranks < sizes[:, None]
+
+class EnsembleGameOfLife(object):
+  def __init__(self, g, states, birth=(3,), survival=(2, 3), window=64):
+    # Initializes an ensemble of games of life on the graph g (as in SparseGameOfLife), member b
+    # starting with the live cells of row b of the (B, n) 0/1 array states. A member stops when it
+    # dies out or returns to one of its last window states (0 = only on extinction).
+    self.g = g if isinstance(g, CsrGraph) else CsrGraph.from_networkx(g)
+    self._adjacency, self._rule, self._stride = sparse_rule(self.g, birth, survival)
+    states = np.asarray(states, dtype=bool)
+    self.size = len(states)
+    self.window = window
+    self.t = 0
+    # Per-member counters: population at the current tick, maximum population, the tick of
+    # extinction, and the period and transient of the cycle the member ended in (-1 if none).
+    self.population = states.sum(axis=1)
+    self.max_population = self.population.copy()
+    self.extinction = np.where(self.population == 0, 0, -1)
+    self.period = -np.ones(self.size, dtype=int)
+    self.transient = -np.ones(self.size, dtype=int)
+    # The members still running, and their states cell-major (n, active) so that one sparse
+    # product counts the live neighbors of all of them. Stopped members keep their last state.
+    self._final = states.copy()
+    self._active = np.flatnonzero(self.population)
+    self._states = np.ascontiguousarray(states[self._active].T).view(np.uint8)
+    # Zobrist hashes of the states of the last window ticks of the running members; row t % window
+    # holds tick _history_t[t % window].
+    self._cell_keys = zobrist.keys(np.arange(self.g.number_of_nodes()), 1)[:, None]
+    self._history = np.zeros((window, len(self._active)), dtype=np.uint64)
+    self._history_t = -np.ones(window, dtype=int)
+    self._record(self._hash(self._states))
+
+  @property
+  def states(self):
+    # (B, n) bool array of the current states of the running members, and of the last states of
+    # the members that stopped.
+    states = self._final.copy()
+    states[self._active] = self._states.T
+    return states
+
+  def alive(self):
+    # Number of running members.
+    return len(self._active)
+
+  def _hash(self, states):
+    return np.bitwise_xor.reduce(self._cell_keys * states, axis=0)
+
+  def _record(self, hashes):
+    if self.window:
+      self._history[self.t % self.window] = hashes
+      self._history_t[self.t % self.window] = self.t
+
+  def tick(self):
+    # Advances all running members to the next time step (tick), and stops those that die out or
+    # repeat a state.
+    self.t += 1
+    num_live_nbhrs = self._adjacency.dot(self._states)
+    states = np.take(self._rule, num_live_nbhrs + self._states * self._stride).view(np.uint8)
+    population = states.sum(axis=0)
+    self.population[self._active] = population
+    np.maximum(self.max_population, self.population, out=self.max_population)
+    extinct = population == 0
+    stopped = extinct
+    if self.window:
+      hashes = self._hash(states)
+      match = (self._history == hashes) & (self._history_t >= 0)[:, None]
+      cycle = match.any(axis=0) & ~extinct
+      if cycle.any():
+        start = self._history_t[np.argmax(match[:, cycle], axis=0)]
+        self.period[self._active[cycle]] = self.t - start
+        self.transient[self._active[cycle]] = start
+        stopped = extinct | cycle
+    self.extinction[self._active[extinct]] = self.t
+    if stopped.any():
+      self._final[self._active[stopped]] = states[:, stopped].T
+      self._active = self._active[~stopped]
+      states = np.ascontiguousarray(states[:, ~stopped])
+      self._history = np.ascontiguousarray(self._history[:, ~stopped])
+      if self.window:
+        hashes = hashes[~stopped]
+    self._states = states
+    if self.window:
+      self._record(hashes)
+
+  def run(self, max_ticks):
+    # Ticks until all members stop or max_ticks ticks have passed. Returns the extinction ticks.
+    while self._active.size and self.t < max_ticks:
+      self.tick()
+    return self.extinction
+
 if __name__ == '__main__':
   # Read command-line arguments.
-  if len(sys.argv) != 2:
-    print 'Usage: game_of_life.py <neighbors-graph-pickle-file>'
+  if len(sys.argv) not in (2, 3):
+    print 'Usage: game_of_life.py <neighbors-graph-file> [ensemble-size]'
     sys.exit(1)
-  g = nx.read_gpickle(sys.argv[1])
+  g = load_graph(sys.argv[1])
+
+  if len(sys.argv) == 3:
+    # Lifetime statistics of an ensemble of random initial populations.
+    start = time.time()
+    ensemble = EnsembleGameOfLife(g, random_populations(g.number_of_nodes(), int(sys.argv[2])))
+    extinction = ensemble.run(100)
+    print '%d simulations, %.2fs' % (ensemble.size, time.time() - start)
+    print 'Running after %d ticks' % ensemble.t, ensemble.alive()
+    print 'Extinction tick frequencies', sorted(Counter(extinction[extinction >= 0]).iteritems())
+    print 'Cycle period frequencies', sorted(Counter(ensemble.period[ensemble.period > 0]).iteritems())
+    sys.exit(0)
 
   while True:
     initial_population_size = random.randint(int(0.1 * g.number_of_nodes()), g.number_of_nodes())
     print 'Initial population size', initial_population_size
     initial_population = random.sample(g.nodes(), initial_population_size)
-    game = GameOfLife(g, initial_population)
+    game = SparseGameOfLife(g, initial_population)
     print game.live
+    # Stop simulation on extinction, or once it cycles.
+    policy, detector = RestartPolicy(max_ticks=100), CycleDetector()
+    detector.update(game.key())
     time.sleep(0.3)
-    for tick in xrange(100):
+    while not policy.reason(game, detector):
       game.tick()
-      print tick, ' '.join(map(str, sorted(game.live.iteritems())))
+      detector.update(game.key())
+      print detector.t - 1, ' '.join(map(str, sorted(game.live.iteritems())))
       time.sleep(0.3)
-      # Stop simulation on extinction.
-      if not game.live: break
+    print 'Stopped:', policy.reason(game, detector), 'period', detector.period, 'transient', detector.transient
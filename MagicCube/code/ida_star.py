@@ -0,0 +1,376 @@
+'''
+============================================================
+Optimal 3x3x3 solver: IDA* with the search tree split across
+processes.
+
+A state is the corner permutation (8! = 40320) and twist (3^7 = 2187)
+and, for each of three groups of 4 edges, the places and flips of the
+group's edges (12!/8! * 2^4 = 190080). Move tables give these
+coordinates after each of the 18 face turns. The pruning tables are
+the distance (half-turn metric) of every corner state (88179840
+entries, 4 bits each) and of every state of each edge group; the
+largest of the four bounds the distance of a state.
+
+All tables are .npy files in a cache directory (by default TABLE_DIR,
+next to this module), built on first use and then loaded memory-mapped, so worker processes share one copy of them
+through the page cache.
+
+For each bound of IDA*, the tree is expanded to split_depth moves in
+the calling process; each node there is a task for a process pool.
+A worker that finds a solution sets a shared event: the others give
+up their subtrees at their next expansion, and the tasks still queued
+return without searching. Any solution within the bound is optimal,
+since all smaller bounds failed.
+
+- solver = ParallelSolver(workers=4, split_depth=3, cache_dir='tables')
+- solver.solve(color_id) = an optimal solution of the color_id() array
+  of a cube_interactive Cube(3), as a move string for the cube held as
+  it is; solver.stats has the nodes and time of each bound.
+============================================================
+'''
+import os, itertools, time, multiprocessing
+import numpy as np
+from algorithms import CubeMoves
+from permgroup import state_validator
+from pocket_cube import _rank
+
+MOVES = [(face, d) for face in 'UDLRBF' for d in (1, 2, -1)]
+OPPOSITE = dict(U='D', D='U', L='R', R='L', B='F', F='B')
+TWISTS = 2187
+CORNER_STATES = 40320 * TWISTS
+EDGE_STATES = 11880 * 16
+# Default cache directory of the tables.
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+# Distance of states the search has not reached.
+UNKNOWN = 15
+
+def piece_moves(cube_moves, slots):
+    '''Returns (source, twist), shape (18, pieces): after move m, slot j holds the piece
+    of slot source[m, j], with its orientation increased by twist[m, j]. slots lists
+    the sticker positions of each piece slot (as StateValidator._corners).'''
+    size = slots.shape[1]
+    where = dict((p, (k, i)) for k, stickers in enumerate(slots) for i, p in enumerate(stickers))
+    source, twist = [], []
+    for face, d in MOVES:
+        g = cube_moves._moves[(face, 0, d)]
+        source.append([where[g[stickers[0]]][0] for stickers in slots])
+        twist.append([-where[g[stickers[0]]][1] % size for stickers in slots])
+    return np.array(source), np.array(twist)
+
+def _edge_rank_table():
+    # Rank of each ordered 4-tuple of distinct edge slots (by a*12^3 + b*12^2 + c*12 + d).
+    tuples = np.array(list(itertools.permutations(range(12), 4)))
+    rank = -np.ones(12 ** 4, dtype=np.int32)
+    rank[np.dot(tuples, 12 ** np.arange(3, -1, -1))] = np.arange(len(tuples))
+    return tuples, rank
+
+def _bfs(neighbors, size, start):
+    # Distances from the start states by breadth-first search, as a uint8 array;
+    # neighbors(index) returns the states one move away, shape (len(index), 18).
+    distance = np.empty(size, dtype=np.uint8)
+    distance.fill(UNKNOWN)
+    distance[start] = 0
+    depth = 0
+    while True:
+        frontier = np.nonzero(distance == depth)[0]
+        if not len(frontier):
+            return distance
+        depth += 1
+        for chunk in np.array_split(frontier, max(1, len(frontier) // (1 << 20))):
+            reached = neighbors(chunk).ravel()
+            distance[reached[distance[reached] == UNKNOWN]] = depth
+
+class SolverTables(object):
+    '''Move and pruning tables of the solver, stored as .npy files in cache_dir
+    (TABLE_DIR if None).'''
+    files = ['corner_perm_moves', 'corner_twist_moves', 'edge_moves', 'corner_distances',
+             'edge_distances']
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or TABLE_DIR
+        self._moves = CubeMoves(3)
+        self._validator = state_validator(3)
+        self._corner_source, self._corner_twist = piece_moves(self._moves, self._validator._corners)
+        self._edge_source, self._edge_twist = piece_moves(self._moves, self._validator._edges)
+        self._edge_tuples, self._edge_rank = _edge_rank_table()
+        if not self.exist(self.cache_dir):
+            self.build()
+        for name in self.files:
+            setattr(self, name, np.load(self._file(name), mmap_mode='r'))
+
+    @classmethod
+    def exist(cls, cache_dir=None):
+        '''Returns True if cache_dir (TABLE_DIR if None) holds all the tables, so that
+        they load at once instead of being built (about 30s and 1 GB of memory).'''
+        cache_dir = cache_dir or TABLE_DIR
+        return all(os.path.exists(os.path.join(cache_dir, name + '.npy')) for name in cls.files)
+
+    def _file(self, name):
+        return os.path.join(self.cache_dir, name + '.npy')
+
+    def edge_coordinate(self, slots, flips):
+        '''Coordinates of edge groups whose edges are in the given slots (shape (B, 4))
+        with the given flips.'''
+        return self._edge_rank[np.dot(slots, 12 ** np.arange(3, -1, -1))] * 16 + \
+               np.dot(flips, 1 << np.arange(4))
+
+    def solved(self):
+        '''Coordinates (corner perm, twist, edge groups...) of the solved cube.'''
+        groups = self.edge_coordinate(np.arange(12).reshape(3, 4), np.zeros((3, 4), dtype=int))
+        return (0, 0) + tuple(groups)
+
+    def build(self):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # Corners: new slot j holds the piece and twist of slot source[j].
+        perms = np.array(list(itertools.permutations(range(8))))
+        corner_perm_moves = np.array([_rank(perms[:, source]) for source in self._corner_source],
+                                     dtype=np.int32).T
+        digits = np.array(list(itertools.product(range(3), repeat=7)))[:, ::-1]
+        twists = np.hstack([digits, -digits.sum(axis=1)[:, None] % 3])
+        corner_twist_moves = np.array([np.dot((twists[:, source] + twist)[:, :7] % 3, 3 ** np.arange(7))
+                                       for source, twist in zip(self._corner_source, self._corner_twist)],
+                                      dtype=np.int32).T
+        # Edge groups: the edge in slot s moves to the slot j with source[j] = s.
+        slots = np.repeat(self._edge_tuples, 16, axis=0)
+        flips = np.tile(np.array(list(itertools.product(range(2), repeat=4)))[:, ::-1],
+                        (len(self._edge_tuples), 1))
+        edge_moves = []
+        for source, twist in zip(self._edge_source, self._edge_twist):
+            destination = np.argsort(source)
+            moved = destination[slots]
+            edge_moves.append(self.edge_coordinate(moved, (flips + twist[moved]) % 2))
+        edge_moves = np.array(edge_moves, dtype=np.int32).T
+
+        corners = _bfs(lambda i: corner_perm_moves[i // TWISTS] * TWISTS + corner_twist_moves[i % TWISTS],
+                       CORNER_STATES, 0)
+        tables = dict(corner_perm_moves=corner_perm_moves, corner_twist_moves=corner_twist_moves,
+                      edge_moves=edge_moves, corner_distances=corners[0::2] | (corners[1::2] << 4),
+                      edge_distances=np.array([_bfs(lambda i: edge_moves[i], EDGE_STATES, start)
+                                               for start in self.solved()[2:]]))
+        for name in self.files:
+            np.save(self._file(name), tables[name])
+
+    def coordinates(self, color_id):
+        '''Returns (coordinates, rotation) of a color_id() array: the coordinates of the
+        state once the cube is turned by rotation number rotation of
+        StateValidator._rotations to put its centers in place. Raises ValueError for a
+        state that cannot be reached.'''
+        validator = self._validator
+        state = np.asarray(color_id, dtype=int)
+        if not validator.valid(state):
+            raise ValueError('Not a reachable 3x3x3 state')
+        rotation = validator._rotation_of[validator._center_key(state[None])[0]]
+        state = state[validator._rotations[rotation]]
+        corners = validator._corner_table[tuple(state[validator._corners].T)]
+        edges = validator._edge_table[tuple(state[validator._edges].T)]
+        perm = _rank((corners // 3)[None])[0]
+        twist = np.dot(corners[:7] % 3, 3 ** np.arange(7))
+        where = np.argsort(edges // 2)
+        groups = self.edge_coordinate(where.reshape(3, 4), (edges[where] % 2).reshape(3, 4))
+        return (perm, twist) + tuple(groups), rotation
+
+class _Cancelled(Exception):
+    pass
+
+class Search(object):
+    '''Depth-first search below a bound with the tables of a SolverTables. Expands the
+    18 children of a node at once.'''
+    def __init__(self, tables, cancel=None):
+        # Plain arrays over the memory maps: indexing an np.memmap is slower.
+        self.corner_perm_moves = np.asarray(tables.corner_perm_moves)
+        self.corner_twist_moves = np.asarray(tables.corner_twist_moves)
+        self.edge_moves = np.asarray(tables.edge_moves)
+        self.corner_distances = np.asarray(tables.corner_distances)
+        self.edge_distances = np.asarray(tables.edge_distances)
+        self.goal = tables.solved()
+        self.cancel = cancel
+        self.nodes = 0
+        # Moves allowed after each move (or none, index 18): not the same face again,
+        # and opposite faces in one order only.
+        faces = [face for face, _ in MOVES]
+        self._allowed = np.ones((19, 18), dtype=bool)
+        for m, face in enumerate(faces):
+            for k, other in enumerate(faces):
+                if other == face or (other == OPPOSITE[face] and 'UDLRBF'.index(other) < 'UDLRBF'.index(face)):
+                    self._allowed[m, k] = False
+
+    def bound(self, node):
+        '''Lower bound of the distance of node.'''
+        return int(self._bounds(tuple(np.array([x]) for x in node))[0])
+
+    def _bounds(self, nodes):
+        # Lower bounds of the distances of nodes given as arrays of coordinates.
+        corner = nodes[0] * TWISTS + nodes[1]
+        h = (self.corner_distances[corner >> 1] >> ((corner & 1) << 2).astype(np.uint8)) & 15
+        for k, e in enumerate(nodes[2:]):
+            h = np.maximum(h, self.edge_distances[k][e])
+        return h
+
+    def children(self, node, last):
+        '''(moves, child nodes, bounds) of the allowed children of node.'''
+        moves = np.nonzero(self._allowed[last])[0]
+        child = (self.corner_perm_moves[node[0]][moves], self.corner_twist_moves[node[1]][moves]) + \
+            tuple(self.edge_moves[e][moves] for e in node[2:])
+        return moves, child, self._bounds(child)
+
+    def search(self, node, g, bound, last=18):
+        '''Returns the list of moves (indices into MOVES) of a solution from node within
+        bound moves in total, g of them already made, or None. Raises _Cancelled when
+        the cancel event is set.'''
+        if node == self.goal:
+            return []
+        self.nodes += 1
+        # is_set() takes well under a microsecond, against tens for an expansion.
+        if self.cancel is not None and self.cancel.is_set():
+            raise _Cancelled()
+        moves, child, h = self.children(node, last)
+        keep = g + 1 + h <= bound
+        for m, c in zip(moves[keep].tolist(), np.array(child)[:, keep].T.tolist()):
+            path = self.search(tuple(c), g + 1, bound, m)
+            if path is not None:
+                return [m] + path
+        return None
+
+    def frontier(self, node, g, bound, depth, path=(), last=18):
+        '''Yields the (path, node, last move) of the nodes depth moves below node within
+        bound, or of a solved node found before.'''
+        if node == self.goal or depth == 0:
+            yield path, node, last
+            return
+        moves, child, h = self.children(node, last)
+        for i in np.nonzero(g + 1 + h <= bound)[0]:
+            for task in self.frontier(tuple(int(c[i]) for c in child), g + 1, bound, depth - 1,
+                                      path + (moves[i],), moves[i]):
+                yield task
+
+# Search of the worker processes, set up by _init_worker.
+_worker = None
+
+def _init_worker(cache_dir, cancel):
+    global _worker
+    _worker = Search(SolverTables(cache_dir), cancel)
+
+def _run_task(task):
+    return _search_task(_worker, task)
+
+def _search_task(search, task):
+    # Searches one subtree: returns (path or None, nodes expanded). Tasks still queued when
+    # the search is cancelled return at once.
+    path, node, last, bound = task
+    search.nodes = 0
+    if search.cancel is not None and search.cancel.is_set():
+        return None, 0
+    try:
+        found = search.search(node, len(path), bound, last)
+    except _Cancelled:
+        found = None
+    if found is not None:
+        search.cancel.set()
+        found = list(path) + found
+    return found, search.nodes
+
+class ParallelSolver(object):
+    '''IDA* solver of 3x3x3 states whose subtrees split_depth moves deep are searched by
+    a pool of workers processes. With use_pool False (the default if workers is 1) they
+    are searched in this process instead. The tables are in cache_dir (TABLE_DIR if
+    None).'''
+    def __init__(self, workers=None, split_depth=3, cache_dir=None, use_pool=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.use_pool = self.workers > 1 if use_pool is None else use_pool
+        self.split_depth = split_depth
+        self.tables = SolverTables(cache_dir)
+        self.cache_dir = self.tables.cache_dir
+        self._cancel = multiprocessing.Event()
+        self._pool = None
+        self._local = Search(self.tables, self._cancel)
+        self._stopped = False
+        self.stats = []
+
+    def stop(self):
+        '''Makes a solve running in another thread give up and return None, and so do
+        further solves until resume().'''
+        self._stopped = True
+        self._cancel.set()
+
+    def resume(self):
+        self._stopped = False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _map(self, tasks):
+        if not self.use_pool:
+            return (_search_task(self._local, task) for task in tasks)
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, _init_worker, (self.cache_dir, self._cancel))
+        return self._pool.imap_unordered(_run_task, tasks)
+
+    def solve_coordinates(self, node, max_moves=20):
+        '''Returns an optimal solution of the state with coordinates node, as a list of
+        indices into MOVES, or None if it is longer than max_moves or stop() was called.'''
+        search = Search(self.tables)
+        self.stats = []
+        for bound in xrange(search.bound(node), max_moves + 1):
+            t = time.time()
+            self._cancel.clear()
+            if self._stopped:
+                return None
+            tasks = [(path, child, last, bound)
+                     for path, child, last in search.frontier(node, 0, bound, self.split_depth)]
+            solution, nodes = None, search.nodes
+            results = self._map(tasks)
+            for found, count in results:
+                nodes += count
+                if found is not None:
+                    solution = found
+                    break
+            if self.use_pool:
+                # The cancelled tasks left in the pool return at once; collect them so that
+                # none of them is still queued for the next solve.
+                for found, count in results:
+                    nodes += count
+            self.stats.append(dict(bound=bound, tasks=len(tasks), nodes=nodes, seconds=time.time() - t))
+            if solution is not None and not self._stopped:
+                return solution
+        return None
+
+    def solve(self, color_id, max_moves=20):
+        '''Returns an optimal solution (half-turn metric) of the color_id() array of a
+        Cube(3), in the notation of notation.py, for the cube held as it is; None as
+        for solve_coordinates().'''
+        node, rotation = self.tables.coordinates(color_id)
+        solution = self.solve_coordinates(node, max_moves)
+        if solution is None:
+            return None
+        # Moves after the rotation that put the centers in place, as seen before it.
+        moves = self.tables._moves
+        r = self.tables._validator._rotations[rotation]
+        result = []
+        for m in solution:
+            face, d = MOVES[m]
+            g = r[moves._moves[(face, 0, d)]]
+            face = [f for f in 'UDLRBF' if np.array_equal(moves._moves[(f, 0, d)][r], g)][0]
+            result.append(face + {1: '', 2: '2', -1: "'"}[d])
+        return ' '.join(result)
+
+if __name__ == '__main__':
+    import sys
+    import notation
+    from cube_interactive import Cube
+    scramble = sys.argv[1] if len(sys.argv) > 1 else "R U2 F' L D' B2 R' U F2 L'"
+    t = time.time()
+    tables = SolverTables()
+    print 'Tables ready (%.1fs)' % (time.time() - t)
+    c = Cube(3)
+    for face, l, d in notation.parse(scramble, 3):
+        c.rotate_face(face, d, layer=l)
+    for workers in sorted(set([1, multiprocessing.cpu_count()])):
+        solver = ParallelSolver(workers=workers)
+        t = time.time()
+        solution = solver.solve(c.color_id())
+        print '%d workers: %s (%d moves, %d nodes, %.2fs)' % (
+            workers, solution, len(solution.split()), sum(s['nodes'] for s in solver.stats), time.time() - t)
+        solver.close()
@@ -0,0 +1,277 @@
+'''
+============================================================
+Recognition of last-layer cases of the 3x3x3 cube.
+
+The last layer is whatever face is up (U) in the color_id() array.
+States are first recolored so that each face takes the solved color
+of its center, which makes recognition independent of the color
+scheme and of which face the solver chose as the last layer.
+
+All last-layer states (62208) are enumerated once from the solved
+cube; from them, lookup tables map a state to its OLL case (pattern of
+the U color on the sides of the last layer) and, once the last layer
+is oriented, to its PLL case. Both tables hold the same case for all
+turns of the U face before and after, so recognition is a few array
+lookups per state.
+
+- recognizer = last_layer_recognizer()
+- oll, pll = recognizer.cases(color_ids) for a batch of color_id()
+  arrays; -1 marks states that are not in that stage.
+- recognizer.oll_algorithms[oll] = (name, moves) of an algorithm of
+  algorithms.txt for the case, or None (same for pll_algorithms).
+- recognizer.next_moves(color_ids) = the moves to perform next,
+  with the U turn that sets the case up for its algorithm.
+- recognizer.pairs(color_ids) = F2L pair codes of the four slots.
+============================================================
+'''
+import os
+import numpy as np
+from cube_interactive import Cube
+from algorithms import CubeMoves, algorithm_index
+from permgroup import state_validator
+
+# U turns (AUF) by number of quarter turns.
+AUF = ['', 'U', 'U2', "U'"]
+
+class LastLayerRecognizer(object):
+    '''Vectorized OLL/PLL/F2L-pair recognition of color_id() arrays of a 3x3x3 cube.'''
+    def __init__(self, index=None):
+        N = 3
+        self._moves = moves = CubeMoves(N)
+        self._validator = validator = state_validator(N)
+        self.solved = validator.solved
+        lattice = np.rint(N * Cube.base_geometry(N)['face_centroids'][:, :3]).astype(int)
+        self._centers = validator._centers
+        # Positions of the last layer: the U face and the top row of the sides.
+        top = np.nonzero(lattice[:, 1] == N)[0]
+        self._sides = np.nonzero(lattice[:, 1] == N - 1)[0]
+        self._u_color = self.solved[top[0]]
+        self._f2l = np.nonzero(lattice[:, 1] < N - 1)[0]
+        # Code 0..3 of the colors of the sides.
+        self._side_code = -np.ones(6, dtype=int)
+        self._side_code[np.unique(self.solved[self._sides])] = np.arange(4)
+        self._u = moves.effect('U')
+        self._y = moves.effect('y')
+
+        states = self._enumerate()
+        self._build_oll(states, index)
+        self._build_pll(states, index)
+        self._build_pairs(lattice)
+
+    def _enumerate(self):
+        # Breadth-first search of the last-layer states from the solved cube.
+        generators = [self._moves.effect(text) for text in
+                      ['U', "R U R' U R U2 R'", "F R U R' U' F'", "R U R' U' R' F R2 U' R' U' R U R' F'"]]
+        found = set([self.solved.astype(np.uint8).tostring()])
+        states = [self.solved]
+        for s in states:
+            for g in generators:
+                t = s[g]
+                key = t.astype(np.uint8).tostring()
+                if key not in found:
+                    found.add(key)
+                    states.append(t)
+        return np.array(states)
+
+    def recolor(self, color_ids):
+        '''Returns the batch of color_id() arrays with every face recolored to the
+        solved color of its center.'''
+        states = np.atleast_2d(np.asarray(color_ids, dtype=int))
+        rows = np.arange(len(states))[:, None]
+        relabel = np.zeros((len(states), 6), dtype=int)
+        relabel[rows, states[:, self._centers]] = self.solved[self._centers]
+        return relabel[rows, states]
+
+    def _oll_key(self, states):
+        # Bit mask of the top-row side stickers that show the U color.
+        return np.dot(states[:, self._sides] == self._u_color, 1 << np.arange(len(self._sides)))
+
+    def _pll_key(self, states):
+        return np.dot(self._side_code[states[:, self._sides]], 4 ** np.arange(len(self._sides)))
+
+    def _variants(self, states):
+        # The states after each U turn, from each of the four sides (y rotations,
+        # recolored), shape (16, B, 54).
+        result = []
+        for _ in xrange(4):
+            for _ in xrange(4):
+                result.append(states)
+                states = states[:, self._u]
+            states = self.recolor(states[:, self._y])
+        return np.array(result)
+
+    def _case_table(self, keys, size):
+        # Numbers the classes of keys (shape (16, B), all variants of B states) with 0 for
+        # the solved state, then in order of their smallest key. Returns the table
+        # key -> case and the case of each state.
+        smallest = keys.min(axis=0)
+        classes = np.unique(smallest)
+        solved = np.searchsorted(classes, smallest[0])
+        order = np.r_[solved, np.delete(np.arange(len(classes)), solved)]
+        number = np.empty(len(classes), dtype=np.int8)
+        number[order] = np.arange(len(classes))
+        case = number[np.searchsorted(classes, smallest)]
+        table = -np.ones(size, dtype=np.int8)
+        table[keys] = case
+        return table, case
+
+    def _build_oll(self, states, index):
+        keys = np.array([self._oll_key(s) for s in self._variants(states)])
+        self._oll_table, case = self._case_table(keys, 1 << len(self._sides))
+        self.oll_algorithms = self._algorithms(states, case, index, self._oriented)
+        self._oll_auf = self._auf_table(states, keys[0], case, self.oll_algorithms, self._oriented,
+                                        len(self._oll_table))
+
+    def _build_pll(self, states, index):
+        states = states[self._oriented(states)]
+        keys = np.array([self._pll_key(s) for s in self._variants(states)])
+        self._pll_table, case = self._case_table(keys, 4 ** len(self._sides))
+        self.pll_algorithms = self._algorithms(states, case, index, self._solved)
+        self._pll_auf = self._auf_table(states, keys[0], case, self.pll_algorithms, self._solved,
+                                        len(self._pll_table))
+
+    def _oriented(self, states):
+        return (states[:, self._f2l] == self.solved[self._f2l]).all(axis=1) & \
+               (self._oll_key(states) == 0)
+
+    def _solved(self, states):
+        return (states == self.solved).all(axis=1)
+
+    def _turn_u(self, states, k):
+        return states[:, self._moves.sequence([('U', 0, 1)] * k)]
+
+    def _algorithms(self, states, case, index, done):
+        # For each case but the solved one, the first of the shortest algorithms that
+        # makes done() hold for an example state, after U turns before and after it.
+        if index is None:
+            index = algorithm_index(3, [os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                     'algorithms.txt')])
+        examples = states[np.unique(case, return_index=True)[1]]
+        candidates = sorted((len(text.split()), name, text) for name, text in index.algorithms)
+        result = [None] * len(examples)
+        for _, name, text in candidates:
+            g = self._moves.effect(text)
+            for before in xrange(4):
+                after = self._turn_u(examples, before)[:, g]
+                solved = np.any([done(self._turn_u(after, k)) for k in xrange(4)], axis=0)
+                for c in np.nonzero(solved)[0]:
+                    if c > 0 and result[c] is None:
+                        result[c] = (name, text)
+        return result
+
+    def _auf_table(self, states, keys, case, algorithms, done, size):
+        # Table key -> U turns to make before the algorithm of the case of the state so
+        # that done() holds after it or after a further U turn; for the solved case, the
+        # U turns after which done() holds. -1 where there is no algorithm.
+        table = -np.ones(size, dtype=np.int8)
+        for c in xrange(len(algorithms)):
+            if c == 0:
+                g, finish = self._moves.identity, [0]
+            elif algorithms[c] is None:
+                continue
+            else:
+                g, finish = self._moves.effect(algorithms[c][1]), xrange(4)
+            members = np.nonzero(case == c)[0]
+            for before in xrange(3, -1, -1):
+                after = self._turn_u(states[members], before)[:, g]
+                solved = np.any([done(self._turn_u(after, k)) for k in finish], axis=0)
+                table[keys[members[solved]]] = before
+        return table
+
+    def _classify(self, states):
+        # (oll, pll, oll key, pll key) of recolored states.
+        f2l = (states[:, self._f2l] == self.solved[self._f2l]).all(axis=1)
+        oll_key = self._oll_key(states)
+        oll = np.where(f2l, self._oll_table[oll_key], -1)
+        top = np.all(states[:, self._sides] != self._u_color, axis=1)
+        pll_key = np.where(f2l & (oll == 0) & top, self._pll_key(states), 0)
+        pll = np.where(f2l & (oll == 0) & top, self._pll_table[pll_key], -1)
+        return oll, pll, oll_key, pll_key
+
+    def cases(self, color_ids):
+        '''Returns the (oll, pll) case numbers of a batch of color_id() arrays (or of a
+        single one). oll is -1 unless the first two layers are solved; pll is -1
+        unless the last layer is also oriented. Case 0 is the solved case.'''
+        oll, pll, _, _ = self._classify(self.recolor(color_ids))
+        return (oll[0], pll[0]) if np.ndim(color_ids) == 1 else (oll, pll)
+
+    def next_moves(self, color_ids):
+        '''Returns the moves of the next last-layer step of each of the color_id() arrays
+        (or of a single one): the OLL algorithm, else the PLL algorithm, else the final
+        U turn, each preceded by its U turn; '' if the cube is solved and None if the
+        state is not in the last layer or has no algorithm.'''
+        oll, pll, oll_key, pll_key = self._classify(self.recolor(color_ids))
+        oll_auf, pll_auf = self._oll_auf[oll_key], self._pll_auf[pll_key]
+        result = []
+        for i in xrange(len(oll)):
+            if oll[i] > 0 and self.oll_algorithms[oll[i]] and oll_auf[i] >= 0:
+                result.append(' '.join([AUF[oll_auf[i]], self.oll_algorithms[oll[i]][1]]).strip())
+            elif pll[i] > 0 and self.pll_algorithms[pll[i]] and pll_auf[i] >= 0:
+                result.append(' '.join([AUF[pll_auf[i]], self.pll_algorithms[pll[i]][1]]).strip())
+            elif pll[i] == 0:
+                result.append(AUF[pll_auf[i]])
+            else:
+                result.append(None)
+        return result[0] if np.ndim(color_ids) == 1 else result
+
+    @property
+    def oll_count(self):
+        return len(self.oll_algorithms)
+
+    @property
+    def pll_count(self):
+        return len(self.pll_algorithms)
+
+    def _build_pairs(self, lattice):
+        # Corner and edge slots of the first two layers: the D-layer corners and the
+        # middle-layer edges, matched by their x, z position.
+        validator = self._validator
+        corner_at = np.sign(lattice[validator._corners].sum(axis=1))
+        edge_at = np.sign(lattice[validator._edges].sum(axis=1))
+        self._pair_corners = np.nonzero(corner_at[:, 1] < 0)[0]
+        self._pair_edges = np.array([np.nonzero((edge_at[:, 1] == 0) & (edge_at[:, 0] == x) &
+                                                (edge_at[:, 2] == z))[0][0]
+                                     for x, _, z in corner_at[self._pair_corners]])
+
+    def pairs(self, color_ids):
+        '''Returns the F2L pair codes of a batch of color_id() arrays, shape (B, 4): for
+        the corner and edge of each slot, ((corner slot * 3 + twist) * 12 + edge slot)
+        * 2 + flip, or -1 if the state is not a valid coloring. A pair is solved when
+        its code equals home_pairs.'''
+        validator = self._validator
+        states = self.recolor(color_ids)
+        corners = validator._corner_table[tuple(np.rollaxis(states[:, validator._corners], 2))]
+        edges = validator._edge_table[tuple(np.rollaxis(states[:, validator._edges], 2))]
+        # Slot of each pair piece, then its orientation there.
+        rows = np.arange(len(states))[:, None]
+        corner_slot = np.argmax(corners[:, :, None] // 3 == self._pair_corners, axis=1)
+        edge_slot = np.argmax(edges[:, :, None] // 2 == self._pair_edges, axis=1)
+        codes = ((corner_slot * 3 + corners[rows, corner_slot] % 3) * 12 + edge_slot) * 2 + \
+                edges[rows, edge_slot] % 2
+        valid = (corners >= 0).all(axis=1) & (edges >= 0).all(axis=1)
+        return np.where(valid[:, None], codes, -1)
+
+    @property
+    def home_pairs(self):
+        return (self._pair_corners * 3 * 12 + self._pair_edges) * 2
+
+_recognizer = None
+
+def last_layer_recognizer():
+    '''Returns the (cached) LastLayerRecognizer of the algorithms in algorithms.txt.'''
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = LastLayerRecognizer()
+    return _recognizer
+
+if __name__ == '__main__':
+    import time
+    t = time.time()
+    recognizer = last_layer_recognizer()
+    print '%d OLL and %d PLL cases (%.2fs)' % (recognizer.oll_count, recognizer.pll_count, time.time() - t)
+    for name, cases in (('OLL', recognizer.oll_algorithms), ('PLL', recognizer.pll_algorithms)):
+        print '%s cases with an algorithm: %d' % (name, sum(case is not None for case in cases))
+    states = recognizer._enumerate()[np.random.randint(62208, size=100000)]
+    t = time.time()
+    oll, pll = recognizer.cases(states)
+    print '%.2f us per state' % (1e6 * (time.time() - t) / len(states))
@@ -1,30 +1,82 @@
 '''Build the nearest neighbor Game of Life graph on the surface of a cube from a file
 containing groups of lines. Within each group, each two consecutive lines are connected
-(8-neighbor pattern.'''
-import sys, networkx as nx, itertools as it
+(8-neighbor pattern.
+
+surface_graph(N, rule) generates the graph of an NxNxN cube directly from the sticker
+centroids of cube_interactive.Cube, as a CsrGraph. Two stickers are neighbors when their
+squares touch: along a side or at a corner point (rule 'corner', the 8-neighbor pattern
+wrapped over the cube edges; corner stickers have 7 neighbors), or along a side only (rule
+'edge', 4 neighbors each).'''
+import os, sys, networkx as nx, itertools as it
+import numpy as np
 from collections import Counter
+from cube_interactive import Cube
+from csr_graph import CsrGraph, line_adjacency_edges
 
-def line_edges(a, b):
-  # Returns the list of nearest-neighbor edges between the cells of two 3-cell lines a and b.
-  return it.chain(((a[i], b[i + 1]) for i in xrange(2)), ((a[i + 1], b[i]) for i in xrange(2)),
-                  ((a[i], a[i + 1]) for i in xrange(2)), ((b[i + 1], b[i]) for i in xrange(2)),
-                  ((a[i], b[i]) for i in xrange(3)))
+# Largest distance of neighbors, in units of half a sticker, by rule: Chebyshev distance of
+# the centroids for 'corner', L1 distance for 'edge'.
+RULES = {'corner': lambda offset: abs(offset).max(), 'edge': lambda offset: abs(offset).sum()}
+# Graphs by (N, rule). If cache_dir is set, they are also saved to and loaded from files there.
+_graphs = {}
+cache_dir = None
 
 def cube_neighbor_graph(file_name):
   # Builds and returns the 3x3x3 cube Game of Life neighbor graph given a file
   # of line adjacencies.
-  with open(file_name, 'rb') as f:
-    line, line_prev, edge_list = [], [], []
-    for line in (map(int, line.strip().split()) for line in f):
-      if line and line_prev:
-        for edge in line_edges(line_prev, line): edge_list.append(edge)
-      line_prev = line
-  return nx.from_edgelist(edge_list, create_using=nx.Graph())
+  return nx.from_edgelist(line_adjacency_edges(file_name), create_using=nx.Graph())
+
+def _surface_graph(N, rule):
+  # Stickers on the lattice of N * centroid (odd coordinates on a face, +-N across it) touch if
+  # their offset is within distance 2 and they are not on opposite faces (for N = 1).
+  lattice = np.rint(N * Cube.base_geometry(N)['sticker_centroids']).astype(int)
+  keys = Cube._lattice_key(lattice / float(N), N)
+  order = np.argsort(keys)
+  normal = np.where(abs(lattice) == N, lattice, 0)
+  edges = []
+  for offset in it.product(range(-2, 3), repeat=3):
+    offset = np.array(offset)
+    if not 0 < RULES[rule](offset) <= 2:
+      continue
+    target = lattice + offset
+    inside = (abs(target) <= N).all(axis=1)
+    u = np.flatnonzero(inside)
+    i = np.minimum(np.searchsorted(keys, Cube._lattice_key(target[u] / float(N), N), sorter=order), len(keys) - 1)
+    v = order[i]
+    touch = (lattice[v] == target[u]).all(axis=1) & ((normal[u] * normal[v]).sum(axis=1) >= 0)
+    edges.append(np.c_[u[touch], v[touch]])
+  return CsrGraph.from_edges(len(lattice), np.vstack(edges))
+
+def surface_graph(N, rule='corner'):
+  # Returns the Game of Life neighbor graph (a CsrGraph) of the stickers of an NxNxN cube, in the
+  # sticker order of cube_interactive.Cube, under the neighbor rule rule (a key of RULES).
+  if rule not in RULES:
+    raise ValueError('Unknown neighbor rule %s' % rule)
+  if (N, rule) not in _graphs:
+    file_name = None
+    if cache_dir is not None:
+      file_name = os.path.join(cache_dir, 'surface_graph_%d_%s.csr' % (N, rule))
+    if file_name is not None and os.path.exists(file_name):
+      g = CsrGraph.load(file_name)
+    else:
+      g = _surface_graph(N, rule)
+      if file_name is not None:
+        g.save(file_name)
+    _graphs[(N, rule)] = g
+  return _graphs[(N, rule)]
 
 if __name__ == "__main__":
   # Read command-line arguments.
+  if len(sys.argv) in (3, 4, 5) and sys.argv[1] == '-N':
+    # Summary of the graph generated for an NxNxN cube, saved to an optional .csr file.
+    g = surface_graph(int(sys.argv[2]), *sys.argv[3:4])
+    print g.number_of_nodes(), 'stickers', g.number_of_edges(), 'edges'
+    print 'Degree frequencies', sorted(Counter(g.degrees()).iteritems())
+    if len(sys.argv) == 5:
+      g.save(sys.argv[4])
+    sys.exit(0)
   if len(sys.argv) != 3:
     print 'Usage: nearest_neighbors_graph.py <line-adjacency-list-file> <output-pickle-file>'
+    print '       nearest_neighbors_graph.py -N <cube-size> [corner|edge [<output-csr-file>]]'
     sys.exit(1)
 
   g = cube_neighbor_graph(sys.argv[1])
@@ -0,0 +1,124 @@
+'''
+============================================================
+Matplotlib-free rasterizer of the unfolded cube net.
+
+Paints the flat map drawn by cube.Cube.render_flat() (the same
+Cube.pltpos face layout) straight into uint8 RGB numpy arrays, for
+dataset previews and contact sheets of thousands of cube states.
+
+- images = render_nets(stickers) for one (6, N, N) sticker array or a
+  batch of shape (B, 6, N, N), e.g. np.array([c.stickers for c in cubes]).
+- write_png(filename, image) encodes one image with zlib only.
+- montage(images, columns) tiles a batch into one contact sheet.
+============================================================
+'''
+import struct, zlib
+import numpy as np
+
+# RGB of Cube.stickercolors, then the background and the plastic.
+DEFAULT_PALETTE = np.array([[255, 255, 255], [255, 207, 0],
+                            [0, 0, 143], [0, 159, 15],
+                            [255, 111, 0], [207, 0, 0]], dtype=np.uint8)
+BACKGROUND = (255, 255, 255)
+PLASTIC = (31, 31, 31)
+
+# Face slots of the net as (column, row-from-top); same layout as Cube.pltpos.
+_FACE_SLOTS = [(1, 0), (1, 2), (1, 1), (3, 1), (2, 1), (0, 1)]
+
+_layouts = {}
+
+def net_layout(N, cell=8, gap=1, pad=4):
+    '''Returns the (H, W) index image of the net of an NxNxN cube: each pixel holds
+    the flat index into the (6, N, N) sticker array of the sticker it shows, or
+    6N^2 for background and 6N^2 + 1 for plastic. A sticker is cell x cell pixels,
+    stickers are separated by gap pixels of plastic and faces by pad pixels of
+    background. Layouts are computed once per argument tuple.'''
+    key = (N, cell, gap, pad)
+    if key not in _layouts:
+        face = N * cell + (N + 1) * gap
+        # Position of each pixel within a face: sticker number along the axis, or -1 on plastic.
+        pos = np.arange(face) - gap
+        along = np.where((pos >= 0) & (pos % (cell + gap) < cell), pos // (cell + gap), -1)
+        j = along[None, :]               # x runs left to right along j
+        k = along[::-1][:, None]         # y runs bottom to top along k
+        background, plastic = 6 * N * N, 6 * N * N + 1
+        layout = np.empty((3 * face + 4 * pad, 4 * face + 5 * pad), dtype=np.intp)
+        layout[:] = background
+        for i, (col, row) in enumerate(_FACE_SLOTS):
+            block = np.where((j >= 0) & (k >= 0), (i * N + j) * N + k, plastic)
+            y0, x0 = pad + row * (face + pad), pad + col * (face + pad)
+            layout[y0:y0 + face, x0:x0 + face] = block
+        layout.flags.writeable = False
+        _layouts[key] = layout
+    return _layouts[key]
+
+def render_nets(stickers, palette=DEFAULT_PALETTE, background=BACKGROUND, plastic=PLASTIC, **kwargs):
+    '''Rasterizes the nets of a batch of cube states. stickers holds the color number
+    of every sticker, shape (6, N, N) or (B, 6, N, N) as in cube.Cube.stickers.
+    Returns uint8 RGB images of shape (H, W, 3) or (B, H, W, 3). kwargs (cell, gap, pad)
+    are passed to net_layout(). The whole batch is painted by one fancy-indexing pass.'''
+    stickers = np.asarray(stickers)
+    single = stickers.ndim == 3
+    if single:
+        stickers = stickers[None]
+    batch, N = stickers.shape[0], stickers.shape[-1]
+    colors = np.vstack([np.asarray(palette, dtype=np.uint8), [background], [plastic]])
+    # Per-state color number of every layout entry (stickers, background, plastic).
+    numbers = np.empty((batch, 6 * N * N + 2), dtype=np.intp)
+    numbers[:, :-2] = stickers.reshape(batch, -1)
+    numbers[:, -2:] = len(colors) - 2, len(colors) - 1
+    images = colors[numbers[:, net_layout(N, **kwargs)]]
+    return images[0] if single else images
+
+def montage(images, columns, pad=0, background=BACKGROUND):
+    '''Tiles a batch of images (B, H, W, 3) into one contact sheet with the given
+    number of columns, separated by pad pixels of background.'''
+    images = np.asarray(images)
+    batch, h, w = images.shape[:3]
+    rows = -(-batch // columns)
+    sheet = np.empty((rows * (h + pad) + pad, columns * (w + pad) + pad, 3), dtype=np.uint8)
+    sheet[:] = background
+    for b in xrange(batch):
+        r, c = divmod(b, columns)
+        y, x = pad + r * (h + pad), pad + c * (w + pad)
+        sheet[y:y + h, x:x + w] = images[b]
+    return sheet
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def encode_png(image, level=6):
+    '''Returns the PNG file contents of a uint8 RGB image of shape (H, W, 3).'''
+    image = np.asarray(image, dtype=np.uint8)
+    h, w = image.shape[:2]
+    # Each scanline is prefixed with filter type 0 (none).
+    raw = np.zeros((h, 1 + 3 * w), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(h, -1)
+    return b''.join([b'\x89PNG\r\n\x1a\n',
+                     _png_chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)),
+                     _png_chunk(b'IDAT', zlib.compress(raw.tostring(), level)),
+                     _png_chunk(b'IEND', b'')])
+
+def write_png(file_name, image, level=6):
+    '''Writes a uint8 RGB image of shape (H, W, 3) to a PNG file.'''
+    with open(file_name, 'wb') as f:
+        f.write(encode_png(image, level=level))
+
+def write_pngs(pattern, images, level=6):
+    '''Writes a batch of images to the PNG files pattern % 0, pattern % 1, ...'''
+    for b, image in enumerate(images):
+        write_png(pattern % b, image, level=level)
+
+if __name__ == '__main__':
+    # Throughput of rendering and encoding a batch of random 3x3x3 nets.
+    import time
+    batch = 2000
+    stickers = np.random.randint(6, size=(batch, 6, 3, 3))
+    t = time.time()
+    images = render_nets(stickers)
+    t_render = time.time() - t
+    t = time.time()
+    data = [encode_png(image) for image in images]
+    t_encode = time.time() - t
+    print 'Image size', images.shape[1:], 'PNG bytes', len(data[0])
+    print 'Render %.0f nets/s, render + PNG %.0f nets/s' % (batch / t_render, batch / (t_render + t_encode))
@@ -0,0 +1,64 @@
+'''
+============================================================
+Standard cube notation.
+
+Translates move strings such as "R U R' U'", "Rw2 3R' M x" into the
+(face, layer, d) moves of cube.Cube.move(): d quarter turns clockwise
+(1, 2 or -1) of layer number layer (0 = the face itself) parallel to
+face.
+
+- U D F B R L: face turns; 2R = second layer only, 2-3R = layers 2..3.
+- Uw or u: wide turns of the face and the next layer; 3Rw = 3 layers.
+- M E S: the middle layer (odd N), turning as L, D and F.
+- x y z: the whole cube, turning as R, U and F.
+- suffix ' for counter-clockwise and a number for repeats (R2, R2').
+============================================================
+'''
+import re
+
+# Faces that turn in the same direction as each slice and whole-cube rotation.
+SLICES = dict(M='L', E='D', S='F')
+ROTATIONS = dict(x='R', y='U', z='F')
+
+_TOKEN = re.compile(r"(\d+)?(?:-(\d+))?([UDFBRLudfbrlMESxyz])(w?)(\d*)('?)(\d*)")
+
+def parse(text, N=3):
+    '''Returns the list of (face, layer, d) moves of the notation string text for an
+    NxNxN cube. Raises ValueError on a token that is not valid for N.'''
+    moves = []
+    for token in text.split():
+        match = _TOKEN.match(token)
+        if not match or match.end() != len(token):
+            raise ValueError('Bad move %r' % (token,))
+        first, last, letter, wide, count, prime, count2 = match.groups()
+        d = (int(count or count2 or 1) * (-1 if prime else 1)) % 4
+        if d == 0:
+            continue
+        d = -1 if d == 3 else d
+        if letter in ROTATIONS:
+            face, layers = ROTATIONS[letter], range(N)
+        elif letter in SLICES:
+            if N % 2 == 0:
+                raise ValueError('%s needs a middle layer, N=%d has none' % (letter, N))
+            face, layers = SLICES[letter], [N // 2]
+        elif letter.islower():
+            face, layers = letter.upper(), range(int(first or 2))
+        elif wide:
+            face, layers = letter, range(int(first or 2))
+        elif last:
+            face, layers = letter, range(int(first) - 1, int(last))
+        else:
+            face, layers = letter, [int(first or 1) - 1]
+        if not layers or max(layers) >= N:
+            raise ValueError('%r needs more than %d layers' % (token, N))
+        moves.extend((face, l, d) for l in layers)
+    return moves
+
+def inverse(moves):
+    '''Returns the moves undoing the move list moves.'''
+    return [(face, l, -d if d != 2 else 2) for face, l, d in moves[::-1]]
+
+def apply(cube, text):
+    '''Performs the moves of the notation string text on the cube.Cube cube.'''
+    for face, l, d in parse(text, cube.N):
+        cube.move(face, l, d)
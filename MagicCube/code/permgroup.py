@@ -0,0 +1,283 @@
+'''
+============================================================
+The cube group as a permutation group of stickers.
+
+Sticker positions are numbered 0..6N^2-1 as in
+cube_interactive.Cube.color_id(). A permutation g acts on a state s
+(any array indexed by position) by s[g]: after the move, position p
+holds what position g[p] held before.
+
+- move_permutations(N) = permutation of every (face, layer) quarter turn.
+- cube_group(N) = PermGroup of all layer moves (Schreier-Sims), with
+  order() and contains(perm).
+- state_validator(N).valid(color_ids) checks a batch of color_id()
+  arrays for reachability: color counts, cubie colorings, corner twist
+  and, for odd N, edge flip and permutation parity. Exact for N <= 3,
+  necessary conditions only for larger cubes.
+============================================================
+'''
+import numpy as np
+from cube_interactive import Cube
+from projection import CUBE_ROTATIONS
+
+def move_permutations(N, faces='UDLRBF'):
+    '''Returns a dict (face, layer) -> sticker permutation of the quarter turn
+    rotate_face(face, 1, layer) of an NxNxN cube, for all faces and layers.'''
+    perms = {}
+    for face in faces:
+        for layer in xrange(N):
+            c = Cube(N)
+            # Label each sticker by its starting position.
+            c._colors = np.arange(6 * N * N)
+            c.rotate_face(face, 1, layer=layer)
+            perms[(face, layer)] = c.color_id()
+    return perms
+
+def _inverse(g):
+    inv = np.empty_like(g)
+    inv[g] = np.arange(len(g))
+    return inv
+
+def _is_identity(g):
+    return np.array_equal(g, np.arange(len(g)))
+
+class PermGroup(object):
+    '''A permutation group given by generators, stored as a base and strong
+    generating set computed by the Schreier-Sims algorithm. Permutations are
+    integer arrays; the product "g then h" is h[g].'''
+    def __init__(self, generators):
+        generators = [np.asarray(g) for g in generators if not _is_identity(g)]
+        self.degree = len(generators[0]) if generators else 0
+        self.base = []
+        # Strong generators fixing base[:i], and the transversal of level i:
+        # orbit point x of base[i] -> (u, u^-1) with u[base[i]] = x.
+        self._strong = []
+        self._transversals = []
+        for g in generators:
+            if all(g[b] == b for b in self.base):
+                self._extend_base(g)
+        for i in xrange(len(self.base)):
+            self._strong[i] = [g for g in generators if all(g[b] == b for b in self.base[:i])]
+            self._transversals[i] = self._orbit(i)
+        self._schreier_sims()
+
+    def _extend_base(self, g):
+        self.base.append(int(np.nonzero(g != np.arange(len(g)))[0][0]))
+        self._strong.append([])
+        self._transversals.append({})
+
+    def _orbit(self, i):
+        # Breadth-first search of the orbit of base[i] under the strong generators of level i.
+        identity = np.arange(self.degree)
+        transversal = {self.base[i]: (identity, identity)}
+        queue = [self.base[i]]
+        for x in queue:
+            u = transversal[x][0]
+            for s in self._strong[i]:
+                y = s[x]
+                if y not in transversal:
+                    v = s[u]
+                    transversal[y] = (v, _inverse(v))
+                    queue.append(y)
+        return transversal
+
+    def _sift(self, g, start=0):
+        # Strips g through the levels from start on. Returns the residue and the level
+        # at which it dropped out (len(base) if it went through).
+        for i in xrange(start, len(self.base)):
+            x = g[self.base[i]]
+            if x not in self._transversals[i]:
+                return g, i
+            g = self._transversals[i][x][1][g]
+        return g, len(self.base)
+
+    def _schreier_sims(self):
+        i = len(self.base) - 1
+        while i >= 0:
+            i = self._check_level(i)
+
+    def _check_level(self, i):
+        # Sifts the Schreier generators of level i. Adds the first non-trivial residue as
+        # a strong generator and returns the deepest level that changed, or returns i - 1
+        # when level i is complete.
+        transversal = self._transversals[i]
+        for x, (u, _) in transversal.items():
+            for s in self._strong[i]:
+                h = transversal[s[x]][1][s[u]]
+                residue, j = self._sift(h, i + 1)
+                if j < len(self.base) or not _is_identity(residue):
+                    if j == len(self.base):
+                        self._extend_base(residue)
+                    for l in xrange(i + 1, j + 1):
+                        self._strong[l].append(residue)
+                        self._transversals[l] = self._orbit(l)
+                    return j
+        return i - 1
+
+    def order(self):
+        '''Returns the number of elements of the group (a Python long).'''
+        order = 1L
+        for transversal in self._transversals:
+            order *= len(transversal)
+        return order
+
+    def contains(self, g):
+        '''Returns True if and only if the permutation g belongs to the group.'''
+        residue, j = self._sift(np.asarray(g))
+        return j == len(self.base) and _is_identity(residue)
+
+_groups = {}
+
+def cube_group(N):
+    '''Returns the (cached) PermGroup generated by all layer moves of an NxNxN cube.
+    The moves of the faces U, R, F generate it, as the other faces turn the same
+    layers.'''
+    if N not in _groups:
+        _groups[N] = PermGroup(move_permutations(N, faces='URF').values())
+    return _groups[N]
+
+def _parity(ids):
+    # Parity of a batch of permutations of shape (B, n), by counting inversions.
+    pairs = np.triu(np.ones((ids.shape[1], ids.shape[1]), dtype=bool), 1)
+    return np.sum((ids[:, :, None] > ids[:, None, :]) & pairs, axis=(1, 2)) % 2
+
+class StateValidator(object):
+    '''Vectorized reachability test of color_id() arrays of an NxNxN cube.'''
+    def __init__(self, N):
+        self.N = N
+        geometry = Cube.base_geometry(N)
+        centroids = geometry['face_centroids'][:, :3]
+        self.solved = geometry['colors']
+        lattice = np.rint(N * centroids).astype(int)
+        axis = np.argmax(abs(lattice), axis=1)
+        # Color of the face on each side (axis, sign) and the two reference axes:
+        # the axis of the faces of color 0, then the next one.
+        side_color = dict(((a, np.sign(x[a])), c) for x, a, c in zip(lattice, axis, self.solved))
+        self._ref = [axis[self.solved == 0][0], (axis[self.solved == 0][0] + 1) % 3]
+        self._pairs = [(side_color[(a, 1)], side_color[(a, -1)]) for a in self._ref]
+
+        # Group the stickers by cubie: the cubie center moves the sticker half a
+        # cubie into the cube along its face axis.
+        cubie = lattice.copy()
+        cubie[np.arange(len(cubie)), axis] -= np.sign(lattice[np.arange(len(cubie)), axis])
+        extreme = (abs(cubie) == N - 1).sum(axis=1)
+        self._centers = np.nonzero((abs(lattice) == 0).sum(axis=1) == 2)[0]
+        self._corners = self._slots(cubie, axis, extreme == 3, 3) if N >= 2 else None
+        self._edges = (self._slots(cubie, axis, (extreme == 2) & ((cubie == 0).sum(axis=1) == 1), 2)
+                       if N >= 3 and N % 2 else None)
+        if self._corners is not None:
+            self._corner_table = self._piece_table(self._corners, 3)
+        if self._edges is not None:
+            self._edge_table = self._piece_table(self._edges, 2)
+        if N % 2:
+            self._center_rotations()
+
+    def _slots(self, cubie, axis, flags, size):
+        # Sticker positions of each cubie of the selected kind, shape (pieces, size),
+        # ordered reference sticker first and, for corners, counter-clockwise.
+        keys = [tuple(x) for x in cubie]
+        slots = {}
+        for p in np.nonzero(flags)[0]:
+            slots.setdefault(keys[p], []).append(p)
+        pieces = []
+        for key in sorted(slots):
+            stickers = slots[key]
+            rank = dict((a, r) for r, a in enumerate(self._ref + [3 - sum(self._ref)]))
+            stickers.sort(key=lambda p: rank[axis[p]])
+            if size == 3:
+                # right-handed order of the sticker normals
+                normals = np.array([np.sign(cubie[p]) * np.eye(3, dtype=int)[axis[p]] for p in stickers])
+                if np.linalg.det(normals) < 0:
+                    stickers[1:] = stickers[2:0:-1]
+            pieces.append(stickers)
+        return np.array(pieces)
+
+    def _piece_table(self, slots, size):
+        # Lookup table of a color tuple in slot order -> piece number * size + orientation,
+        # or -1 for a coloring that no piece has. The orientation is the slot holding the
+        # piece's reference color (its color of the first pair if any, else of the second).
+        table = -np.ones((6,) * size, dtype=int)
+        for piece, colors in enumerate(self.solved[slots]):
+            for r in xrange(size):
+                rotated = tuple(np.roll(colors, r))
+                if size == 2 and not np.in1d(colors, self._pairs[0]).any():
+                    reference = np.in1d(rotated, self._pairs[1])
+                else:
+                    reference = np.in1d(rotated, self._pairs[0])
+                table[rotated] = piece * size + np.nonzero(reference)[0][0]
+        return table
+
+    def _center_rotations(self):
+        # The whole-cube rotation that brings the face centers of a state to their
+        # solved places, looked up by the colors of the centers (base-6 key).
+        N = self.N
+        geometry = Cube.base_geometry(N)
+        order = np.argsort(geometry['lattice_index'])
+        perms = []
+        for M in CUBE_ROTATIONS:
+            rotated = np.dot(geometry['face_centroids'][:, :3], M.T)
+            target = geometry['lattice_index'][np.searchsorted(geometry['lattice_keys'],
+                                                               Cube._lattice_key(rotated, N))]
+            # The sticker at p moves to target[p], so afterwards position target[p] holds s[p].
+            perms.append(_inverse(target))
+        self._rotations = np.array(perms)
+        self._rotation_of = -np.ones(6 ** 6, dtype=int)
+        for r, g in enumerate(self._rotations):
+            # States whose centers this rotation solves: s[g[centers]] = solved[centers].
+            pattern = np.empty(6 * N * N, dtype=int)
+            pattern[g[self._centers]] = self.solved[self._centers]
+            self._rotation_of[self._center_key(pattern[None])[0]] = r
+
+    def _center_key(self, states):
+        return np.dot(states[:, self._centers], 6 ** np.arange(6))
+
+    def valid(self, color_ids):
+        '''Returns a boolean array telling which of the color_id() arrays (a single one or
+        a batch of shape (B, 6N^2)) pass all the tests.'''
+        states = np.asarray(color_ids, dtype=int)
+        single = states.ndim == 1
+        states = np.atleast_2d(states)
+        batch = len(states)
+        ok = (states.min(axis=1) >= 0) & (states.max(axis=1) <= 5)
+        states = np.where(ok[:, None], states, 0)
+        counts = np.zeros((batch, 6), dtype=int)
+        np.add.at(counts, (np.arange(batch)[:, None], states), 1)
+        ok &= (counts == self.N * self.N).all(axis=1)
+        if self.N % 2:
+            # Turn the whole cube so that its centers are in place.
+            r = self._rotation_of[self._center_key(states)]
+            ok &= r >= 0
+            states = states[np.arange(batch)[:, None], self._rotations[np.maximum(r, 0)]]
+        if self._corners is not None:
+            corners = self._corner_table[tuple(np.rollaxis(states[:, self._corners], 2))]
+            ok &= (corners >= 0).all(axis=1)
+            ok &= (np.sort(corners // 3, axis=1) == np.arange(len(self._corners))).all(axis=1)
+            ok &= (corners % 3).sum(axis=1) % 3 == 0
+        if self._edges is not None:
+            edges = self._edge_table[tuple(np.rollaxis(states[:, self._edges], 2))]
+            ok &= (edges >= 0).all(axis=1)
+            ok &= (np.sort(edges // 2, axis=1) == np.arange(len(self._edges))).all(axis=1)
+            ok &= (edges % 2).sum(axis=1) % 2 == 0
+            ok &= _parity(corners // 3) == _parity(edges // 2)
+        return ok[0] if single else ok
+
+_validators = {}
+
+def state_validator(N):
+    '''Returns the (cached) StateValidator of an NxNxN cube.'''
+    if N not in _validators:
+        _validators[N] = StateValidator(N)
+    return _validators[N]
+
+if __name__ == '__main__':
+    import time
+    for N in (2, 3):
+        t = time.time()
+        G = cube_group(N)
+        print 'N=%d group order %d, base length %d (%.2fs)' % (N, G.order(), len(G.base), time.time() - t)
+    # Throughput of validating random colorings, almost all of them unreachable.
+    validator = state_validator(3)
+    states = np.array([np.random.permutation(Cube.base_geometry(3)['colors']) for _ in xrange(100000)])
+    t = time.time()
+    valid = validator.valid(states)
+    print '%.2f us per state, %d of %d valid' % (1e6 * (time.time() - t) / len(states), valid.sum(), len(states))
@@ -0,0 +1,211 @@
+'''
+============================================================
+Optimal solver of the 2x2x2 cube from a complete distance table.
+
+A 2x2x2 state, up to whole-cube rotations, is the permutation and
+twist of 7 corners around a fixed one: index = perm * 729 + twist,
+with perm the rank of the permutation (7! = 5040) and twist the base-3
+digits of 6 corner twists (3^6 = 729), 3674160 states in all. A
+breadth-first search over the 9 turns of the U, R and F faces that
+leave the fixed corner alone fills in the distance of every state to
+the solved one, stored as 4-bit numbers in a .npy file that is loaded
+memory-mapped. A state is then solved by descending the table: at
+each step, one of the 9 turns lowers the distance by one.
+
+- table = pocket_cube_table('pocket_cube.npy') builds the file on
+  first use (a few seconds).
+- table.distance(color_ids) = number of moves (half-turn metric) of
+  optimal solutions, for color_id() arrays of a Cube(2).
+- table.solve(color_id) = an optimal solution in the notation of
+  notation.py, in the orientation the cube is held in.
+============================================================
+'''
+import os, itertools
+import numpy as np
+from algorithms import CubeMoves
+from permgroup import state_validator
+
+FACES = 'URF'
+TURNS = [(face, d) for face in FACES for d in (1, 2, -1)]
+PERMS, TWISTS = 5040, 729
+SIZE = PERMS * TWISTS
+# Distance of states the search has not reached.
+UNKNOWN = 15
+
+def _rank(perms):
+    # Lexicographic rank of a batch of permutations of 0..n-1, shape (B, n).
+    n = perms.shape[1]
+    smaller_after = np.triu(perms[:, :, None] > perms[:, None, :], 1).sum(axis=2)
+    factorials = np.cumprod([1] + range(1, n))[::-1]
+    return np.dot(smaller_after, factorials)
+
+class PocketCube(object):
+    '''Coordinates and move tables of the 2x2x2 cube. The distance table is the uint8
+    array distances, two 4-bit distances per byte (even index in the low half).'''
+    def __init__(self, distances=None):
+        self._moves = moves = CubeMoves(2)
+        self._validator = validator = state_validator(2)
+        self.distances = distances
+        corners = validator._corners
+        # Where each turn takes its pieces from: new slot j holds the piece of slot
+        # source[j], twisted by twist[j].
+        self._source, self._twist = [], []
+        for face, d in TURNS:
+            g = moves._moves[(face, 0, d)]
+            where = dict((p, (k, i)) for k, stickers in enumerate(corners) for i, p in enumerate(stickers))
+            source = [where[g[stickers[0]]][0] for stickers in corners]
+            twist = [-where[g[stickers[0]]][1] % 3 for stickers in corners]
+            self._source.append(source)
+            self._twist.append(twist)
+        self._source, self._twist = np.array(self._source), np.array(self._twist)
+        assert (self._source[:, 0] == 0).all() and (self._twist[:, 0] == 0).all()
+        self._perms = np.array(list(itertools.permutations(range(7))))
+        self._perm_table = self._move_perms()
+        self._twist_table = self._move_twists()
+        # Rotation of a state by the place and twist of the piece of slot 0, and the
+        # turns as seen after each rotation.
+        solved = validator.solved
+        self._rotation_of = np.zeros(24, dtype=int)
+        for k, (r, _) in enumerate(moves.rotations):
+            code = self._corner_codes(solved[moves.inverse_rotations[k]][None])[0]
+            self._rotation_of[np.argmax(code // 3 == 0) * 3 + code[np.argmax(code // 3 == 0)] % 3] = k
+        self._face_after = [self._relabeling(k) for k in xrange(24)]
+
+    def _move_perms(self):
+        # perm table: (5040, 9) ranks after each turn, slot 0 staying in place.
+        full = np.hstack([np.zeros((PERMS, 1), dtype=int), self._perms + 1])
+        return np.array([_rank(full[:, source][:, 1:] - 1) for source in self._source]).T
+
+    def _twist_digits(self):
+        # Twist of each of the 8 slots for every twist coordinate, shape (729, 8).
+        digits = np.array(list(itertools.product(range(3), repeat=6)))[:, ::-1]
+        return np.hstack([np.zeros((TWISTS, 1), dtype=int), digits, -digits.sum(axis=1)[:, None] % 3])
+
+    def _move_twists(self):
+        # twist table: (729, 9) twist coordinates after each turn.
+        twists = self._twist_digits()
+        powers = 3 ** np.arange(6)
+        return np.array([np.dot((twists[:, source] + twist)[:, 1:7] % 3, powers)
+                         for source, twist in zip(self._source, self._twist)]).T
+
+    def _corner_codes(self, states):
+        # piece * 3 + twist of the piece in each corner slot, shape (B, 8).
+        validator = self._validator
+        return validator._corner_table[tuple(np.rollaxis(states[:, validator._corners], 2))]
+
+    def _relabeling(self, k):
+        # The turns seen from rotation k: performing rotation k and then turn m has the
+        # same effect as turn result[m] followed by rotation k.
+        moves = self._moves
+        r = moves.rotations[k][0]
+        result = []
+        for face, d in TURNS:
+            g = r[moves._moves[(face, 0, d)]]
+            result.append(([f for f in 'UDLRBF' if np.array_equal(moves._moves[(f, 0, d)][r], g)][0], d))
+        return result
+
+    def normalize(self, color_ids):
+        '''Returns (index, rotation) of a batch of color_id() arrays: the state index once
+        the cube is turned by rotation number rotation (of CubeMoves(2).rotations) so
+        that the piece of slot 0 is in place; -1 for invalid colorings.'''
+        states = np.atleast_2d(np.asarray(color_ids, dtype=int))
+        # Colors outside 0..5 make a coloring invalid; clip them to look the codes up.
+        in_range = ((states >= 0) & (states < 6)).all(axis=1)
+        states = np.clip(states, 0, 5)
+        codes = self._corner_codes(states)
+        home = np.argmax(codes // 3 == 0, axis=1)
+        rows = np.arange(len(states))
+        rotation = self._rotation_of[home * 3 + codes[rows, home] % 3]
+        states = states[rows[:, None], np.array([g for g, _ in self._moves.rotations])[rotation]]
+        codes = self._corner_codes(states)
+        valid = in_range & (codes >= 0).all(axis=1) & (np.sort(codes // 3, axis=1) == np.arange(8)).all(axis=1) & \
+                ((codes % 3).sum(axis=1) % 3 == 0)
+        codes = np.where(valid[:, None], codes, np.arange(8) * 3)
+        index = _rank(codes[:, 1:] // 3 - 1) * TWISTS + np.dot(codes[:, 1:7] % 3, 3 ** np.arange(6))
+        return np.where(valid, index, -1), rotation
+
+    def neighbors(self, index):
+        '''Returns the indices of the states one turn away from the given ones, shape
+        (B, 9) in the order of TURNS.'''
+        index = np.asarray(index)
+        perm, twist = index // TWISTS, index % TWISTS
+        return self._perm_table[perm] * TWISTS + self._twist_table[twist]
+
+    def lookup(self, index):
+        '''Returns the distances of states given by index.'''
+        index = np.asarray(index)
+        return (self.distances[index >> 1] >> ((index & 1) << 2).astype(np.uint8)) & 15
+
+    def build(self):
+        '''Fills in the distance table by breadth-first search and returns it.'''
+        distance = np.empty(SIZE, dtype=np.uint8)
+        distance.fill(UNKNOWN)
+        distance[0] = 0
+        frontier = np.zeros(1, dtype=int)
+        depth = 0
+        while len(frontier):
+            depth += 1
+            reached = self.neighbors(frontier).ravel()
+            reached = np.unique(reached[distance[reached] == UNKNOWN])
+            distance[reached] = depth
+            frontier = reached
+        self.distances = distance[0::2] | (distance[1::2] << 4)
+        return self.distances
+
+    def save(self, file_name):
+        np.save(file_name, self.distances)
+
+    def distance(self, color_ids):
+        '''Returns the optimal number of moves of color_id() arrays (one or a batch);
+        -1 for invalid colorings.'''
+        index, _ = self.normalize(color_ids)
+        result = np.where(index >= 0, self.lookup(np.maximum(index, 0)), -1)
+        return result[0] if np.ndim(color_ids) == 1 else result
+
+    def solve(self, color_id, reorient=False):
+        '''Returns an optimal solution of the color_id() array, as a move string for the
+        cube held as it is. The cube may end up solved in another orientation; with
+        reorient, the moves end with the x/y/z rotation that brings it back to the solved
+        color_id. Raises ValueError for an invalid coloring.'''
+        index, rotation = self.normalize(color_id)
+        index, rotation = index[0], rotation[0]
+        if index < 0:
+            raise ValueError('Not a 2x2x2 state')
+        turns = self._face_after[rotation]
+        moves = []
+        distance = self.lookup(index)
+        while distance > 0:
+            after = self.neighbors(index)
+            m = np.argmax(self.lookup(after) == distance - 1)
+            face, d = turns[m]
+            moves.append(face + {1: '', 2: '2', -1: "'"}[d])
+            index, distance = after[m], distance - 1
+        if reorient:
+            state = np.asarray(color_id)[self._moves.effect(' '.join(moves))]
+            word = [word for r, word in self._moves.rotations
+                    if np.array_equal(state[r], self._validator.solved)][0]
+            if word:
+                moves.append(word)
+        return ' '.join(moves)
+
+def pocket_cube_table(file_name='pocket_cube.npy'):
+    '''Returns the PocketCube with its distance table memory-mapped from file_name,
+    built and saved there first if the file does not exist.'''
+    if os.path.exists(file_name):
+        return PocketCube(np.load(file_name, mmap_mode='r'))
+    table = PocketCube()
+    table.build()
+    table.save(file_name)
+    return PocketCube(np.load(file_name, mmap_mode='r'))
+
+if __name__ == '__main__':
+    import sys, time
+    file_name = sys.argv[1] if len(sys.argv) > 1 else 'pocket_cube.npy'
+    t = time.time()
+    table = pocket_cube_table(file_name)
+    print 'Table of %d states ready (%.2fs)' % (SIZE, time.time() - t)
+    print 'States by distance:', np.bincount(table.lookup(np.arange(SIZE)))
+    states = np.random.randint(SIZE, size=10000)
+    t = time.time()
+    table.lookup(states)
+    print '%.3f us per lookup' % (1e6 * (time.time() - t) / len(states))
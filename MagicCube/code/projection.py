@@ -1,4 +1,5 @@
 import numpy as np
+import itertools as it
 
 class Quaternion:
     """Quaternion Rotation:
@@ -83,33 +84,128 @@ class Quaternion:
 
         return v, theta
 
+    def normalized(self):
+        """Return the quaternion(s) rescaled to unit norm"""
+        norm = np.sqrt((self.x ** 2).sum(-1))
+        return self.__class__(self.x / norm[..., None])
+
     def as_rotation_matrix(self):
-        """Return the rotation matrix of the (normalized) quaternion"""
-        v, theta = self.as_v_theta()
+        """Return the rotation matrix of the (normalized) quaternion
 
-        shape = theta.shape
-        theta = theta.reshape(-1)
-        v = v.reshape(-1, 3).T
-        c = np.cos(theta)
-        s = np.sin(theta)
+        The matrix is built directly from the quaternion components, so
+        an array of quaternions of shape (..., 4) is converted in one
+        pass into an array of matrices of shape (..., 3, 3).
+        """
+        x = self.x.reshape((-1, 4)).T
+        w, a, b, c = x
+        s = 2. / (x ** 2).sum(0)
 
-        mat = np.array([[v[0] * v[0] * (1. - c) + c,
-                         v[0] * v[1] * (1. - c) - v[2] * s,
-                         v[0] * v[2] * (1. - c) + v[1] * s],
-                        [v[1] * v[0] * (1. - c) + v[2] * s,
-                         v[1] * v[1] * (1. - c) + c,
-                         v[1] * v[2] * (1. - c) - v[0] * s],
-                        [v[2] * v[0] * (1. - c) - v[1] * s,
-                         v[2] * v[1] * (1. - c) + v[0] * s,
-                         v[2] * v[2] * (1. - c) + c]],
-                       order='F').T
-        return mat.reshape(shape + (3, 3))
+        aa, bb, cc = s * a * a, s * b * b, s * c * c
+        wa, wb, wc = s * w * a, s * w * b, s * w * c
+        ab, ac, bc = s * a * b, s * a * c, s * b * c
+
+        mat = np.array([[1. - bb - cc, ab + wc, ac - wb],
+                        [ab - wc, 1. - aa - cc, bc + wa],
+                        [ac + wb, bc - wa, 1. - aa - bb]])
+        return mat.transpose((2, 0, 1)).reshape(self.x.shape[:-1] + (3, 3))
 
     def rotate(self, points):
         M = self.as_rotation_matrix()
         return np.dot(points, M.T)
 
 
+def _cube_rotations():
+    mats = []
+    for perm in it.permutations(range(3)):
+        for signs in it.product((1, -1), repeat=3):
+            mat = np.zeros((3, 3), dtype=int)
+            mat[range(3), perm] = signs
+            if int(round(np.linalg.det(mat))) == 1:
+                mats.append(mat)
+    mats = np.array(mats)
+    mats.flags.writeable = False
+    return mats
+
+# The 24 proper rotations of the cube, identity first.
+CUBE_ROTATIONS = _cube_rotations()
+
+_quarter_turns = {}
+
+
+def quarter_turn_matrix(v, n=1):
+    """Exact rotation matrix of n quarter turns about a coordinate axis
+
+    Parameters
+    ----------
+    v : array_like
+        length-3 vector along one of the coordinate axes (any sign).
+    n : int
+        number of quarter turns, in the sense of ``Quaternion.from_v_theta``.
+
+    Returns
+    -------
+    M : ndarray
+        integer (3, 3) matrix equal to
+        ``Quaternion.from_v_theta(v, n * np.pi / 2).as_rotation_matrix()``.
+        The matrices are computed once and cached; do not modify them.
+    """
+    key = (tuple(np.sign(v).astype(int)), int(n) % 4)
+    try:
+        return _quarter_turns[key]
+    except KeyError:
+        M = Quaternion.from_v_theta(key[0], key[1] * np.pi / 2).as_rotation_matrix()
+        M_int = np.rint(M).astype(int)
+        if not np.allclose(M, M_int):
+            raise ValueError("v must lie along a coordinate axis")
+        M_int.flags.writeable = False
+        _quarter_turns[key] = M_int
+        return M_int
+
+
+def signed_areas(xy):
+    """Signed areas of 2D polygons (shoelace formula)
+
+    Parameters
+    ----------
+    xy : array_like
+        array of polygon vertices, shape (..., Npts, 2).  A repeated
+        closing vertex is allowed.
+
+    Returns
+    -------
+    area : ndarray
+        array of shape xy.shape[:-2]: positive for polygons wound
+        counter-clockwise, negative for clockwise ones.
+    """
+    xy = np.asarray(xy)
+    x, y = xy[..., 0], xy[..., 1]
+    return 0.5 * (x * np.roll(y, -1, -1) - np.roll(x, -1, -1) * y).sum(-1)
+
+
+def visible_order(xy, depth, clockwise=True):
+    """Cull back-facing polygons and sort the rest back to front
+
+    Parameters
+    ----------
+    xy : array_like
+        projected polygon vertices, shape (Npolys, Npts, 2)
+    depth : array_like
+        distance of each polygon from the viewer, shape (Npolys,), such as
+        the third coordinate returned by project_points.
+    clockwise : bool
+        True if polygons facing the viewer are wound clockwise on screen.
+
+    Returns
+    -------
+    ind : ndarray
+        indices of the front-facing polygons, farthest first (painter's
+        order).  Ties keep their original order.
+    """
+    area = signed_areas(xy)
+    front = np.nonzero(area < 0 if clockwise else area > 0)[0]
+    return front[np.argsort(-np.asarray(depth)[front], kind='mergesort')]
+
+
 def project_points(points, q, view, vertical=[0, 1, 0]):
     """Project points using a quaternion q and a view v
 
@@ -161,3 +257,46 @@ def project_points(points, q, view, vertical=[0, 1, 0]):
     return np.array([np.dot(dproj, xdir),
                      np.dot(dproj, ydir),
                      -np.dot(dpoint, zdir)]).transpose(trans)
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: direct quaternion-to-matrix conversion and cached
+    # quarter turns versus the former path through as_v_theta().
+    import timeit
+
+    def as_rotation_matrix_v_theta(q):
+        v, theta = q.as_v_theta()
+        shape = theta.shape
+        theta = theta.reshape(-1)
+        v = v.reshape(-1, 3).T
+        c = np.cos(theta)
+        s = np.sin(theta)
+        mat = np.array([[v[0] * v[0] * (1. - c) + c,
+                         v[0] * v[1] * (1. - c) - v[2] * s,
+                         v[0] * v[2] * (1. - c) + v[1] * s],
+                        [v[1] * v[0] * (1. - c) + v[2] * s,
+                         v[1] * v[1] * (1. - c) + c,
+                         v[1] * v[2] * (1. - c) - v[0] * s],
+                        [v[2] * v[0] * (1. - c) - v[1] * s,
+                         v[2] * v[1] * (1. - c) + v[0] * s,
+                         v[2] * v[2] * (1. - c) + c]],
+                       order='F').T
+        return mat.reshape(shape + (3, 3))
+
+    np.random.seed(0)
+    for size in (1, 1000, 100000):
+        q = Quaternion(np.random.randn(size, 4)).normalized()
+        assert np.allclose(q.as_rotation_matrix(), as_rotation_matrix_v_theta(q))
+        number = max(10, 100000 // size)
+        t_old = timeit.timeit(lambda: as_rotation_matrix_v_theta(q), number=number) / number
+        t_new = timeit.timeit(lambda: q.as_rotation_matrix(), number=number) / number
+        print 'as_rotation_matrix, %6d quaternions: %9.2f us -> %9.2f us (%.1fx)' % \
+            (size, 1e6 * t_old, 1e6 * t_new, t_old / t_new)
+
+    v = np.array([0., 1., 0.])
+    number = 10000
+    t_old = timeit.timeit(lambda: as_rotation_matrix_v_theta(Quaternion.from_v_theta(v, np.pi / 2)),
+                          number=number) / number
+    t_new = timeit.timeit(lambda: quarter_turn_matrix(v, 1), number=number) / number
+    print 'quarter turn matrix:                %9.2f us -> %9.2f us (%.1fx)' % \
+        (1e6 * t_old, 1e6 * t_new, t_old / t_new)
@@ -0,0 +1,246 @@
+'''
+============================================================
+Recording and playback of cube sessions.
+
+A session log is an append-only binary file of timestamped records:
+face moves (as passed to InteractiveCube.rotate_face), view
+quaternions, color_id keyframes and LED frames. Next to it, an index
+file holds one fixed-size entry (time, offset, type) per record, so a
+player opens multi-hour sessions by memory-mapping both files.
+
+- recorder = SessionRecorder('game.session', N) then
+  recorder.attach(interactive_cube) and/or set
+  led_controller.recorder = recorder.
+- player = SessionPlayer('game.session'); player.seek(ax, t) shows the
+  cube at time t, and player.play(ax, speed=4.) replays it, optionally
+  driving the LED strip with led=led_controller.
+============================================================
+'''
+import os, mmap, struct, time
+import numpy as np
+import matplotlib.pyplot as plt
+from projection import Quaternion
+
+# Record types.
+MOVE, VIEW, STATE, LED = 1, 2, 3, 4
+
+# File header: magic, format version, cube size N, start time.
+_HEADER = struct.Struct('<4sHHd')
+_MAGIC, _VERSION = b'RBKS', 1
+# Record header: time, record type, payload length.
+_RECORD = struct.Struct('<dBI')
+# Payloads of moves (face, layer, turns) and views (quaternion).
+_MOVE = struct.Struct('<cHd')
+_VIEW = struct.Struct('<4d')
+# Index entry of a record: time, offset of the record in the log, type.
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8'), ('type', 'u1')])
+
+def index_file_name(file_name):
+    return file_name + '.idx'
+
+class SessionRecorder(object):
+    '''Appends the events of a cube session to a log file and its index. Opening an
+    existing log continues it.'''
+    def __init__(self, file_name, N):
+        self.file_name = file_name
+        self.N = N
+        if os.path.exists(file_name) and os.path.getsize(file_name) > 0:
+            with open(file_name, 'rb') as f:
+                magic, version, N_file, self.start_time = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or N_file != N:
+                raise ValueError('%s is not a session log of a %dx%dx%d cube' % (file_name, N, N, N))
+            if not index_is_current(file_name):
+                # Continue after the last complete record.
+                end = rebuild_index(file_name)
+                with open(file_name, 'r+b') as f:
+                    f.truncate(end)
+            self._log = open(file_name, 'ab')
+        else:
+            self.start_time = time.time()
+            self._log = open(file_name, 'wb')
+            self._log.write(_HEADER.pack(_MAGIC, _VERSION, N, self.start_time))
+        self._index = open(index_file_name(file_name), 'ab')
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+
+    def _append(self, record_type, payload, t=None):
+        # Writes the record to the log before its index entry, so the index never points
+        # past the end of the log.
+        t = time.time() if t is None else t
+        offset = self._log.tell()
+        self._log.write(_RECORD.pack(t, record_type, len(payload)))
+        self._log.write(payload)
+        self._log.flush()
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry[0] = (t, offset, record_type)
+        self._index.write(entry.tostring())
+        self._index.flush()
+
+    def move(self, face, turns=1, layer=0, t=None):
+        self._append(MOVE, _MOVE.pack(face, layer, turns), t=t)
+
+    def view(self, rot, t=None):
+        self._append(VIEW, _VIEW.pack(*np.asarray(rot.x, dtype=float).ravel()), t=t)
+
+    def state(self, color_id, t=None):
+        self._append(STATE, np.asarray(color_id, dtype=np.uint8).tostring(), t=t)
+
+    def led(self, colors, t=None):
+        # colors = list of 6-digit hex colors, one per LED.
+        self._append(LED, ''.join(colors).decode('hex'), t=t)
+
+    def attach(self, ax):
+        '''Records the moves, views and states of the InteractiveCube ax from now on,
+        starting with a keyframe of its current state and view.'''
+        ax.recorder = self
+        self.state(ax.cube.color_id())
+        self.view(ax._current_rot)
+
+def index_is_current(file_name):
+    '''Returns True if the index of a session log exists and its last entry is the
+    record that ends the log.'''
+    index_name = index_file_name(file_name)
+    if not os.path.exists(index_name) or os.path.getsize(index_name) % INDEX_DTYPE.itemsize:
+        return False
+    size = os.path.getsize(file_name)
+    if os.path.getsize(index_name) == 0:
+        return size == _HEADER.size
+    with open(index_name, 'rb') as f:
+        f.seek(-INDEX_DTYPE.itemsize, os.SEEK_END)
+        offset = int(np.frombuffer(f.read(INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)['offset'][0])
+    if offset + _RECORD.size > size:
+        return False
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        t, record_type, length = _RECORD.unpack(f.read(_RECORD.size))
+    return offset + _RECORD.size + length == size
+
+def rebuild_index(file_name):
+    '''Regenerates the index of a session log by scanning the log, e.g. if the index
+    was lost or a crash left it shorter than the log. Returns the offset of the end of
+    the last complete record.'''
+    entries = []
+    with open(file_name, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = _HEADER.size
+        while offset + _RECORD.size <= len(data):
+            t, record_type, length = _RECORD.unpack_from(data, offset)
+            if offset + _RECORD.size + length > len(data):
+                break
+            entries.append((t, offset, record_type))
+            offset += _RECORD.size + length
+        data.close()
+    np.array(entries, dtype=INDEX_DTYPE).tofile(index_file_name(file_name))
+    return offset
+
+class SessionPlayer(object):
+    '''Random access to a session log. The log and its index are memory-mapped, so
+    opening a session takes constant time regardless of its length.'''
+    def __init__(self, file_name):
+        if not index_is_current(file_name):
+            rebuild_index(file_name)
+        self._file = open(file_name, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.N, self.start_time = _HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC:
+            raise ValueError('%s is not a session log' % (file_name,))
+        if os.path.getsize(index_file_name(file_name)) >= INDEX_DTYPE.itemsize:
+            self.index = np.memmap(index_file_name(file_name), dtype=INDEX_DTYPE, mode='r')
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        # Record times relative to the start of the session.
+        self.times = self.index['time'] - self.start_time
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def duration(self):
+        return self.times[-1] if len(self.times) else 0.
+
+    def record(self, i):
+        '''Returns the (time, type, value) of record i. The value is (face, turns, layer)
+        for a move, a Quaternion for a view, the color_id array for a state and the list
+        of hex LED colors for an LED frame.'''
+        offset = int(self.index['offset'][i])
+        t, record_type, length = _RECORD.unpack_from(self._data, offset)
+        offset += _RECORD.size
+        if record_type == MOVE:
+            face, layer, turns = _MOVE.unpack_from(self._data, offset)
+            value = (face, turns, layer)
+        elif record_type == VIEW:
+            value = Quaternion(_VIEW.unpack_from(self._data, offset))
+        elif record_type == STATE:
+            value = np.frombuffer(self._data, dtype=np.uint8, count=length, offset=offset).astype(int)
+        else:
+            hex_colors = self._data[offset:offset + length].encode('hex').upper()
+            value = [hex_colors[k:k + 6] for k in xrange(0, len(hex_colors), 6)]
+        return t - self.start_time, record_type, value
+
+    def position(self, t):
+        '''Returns the number of records up to and including time t.'''
+        return np.searchsorted(self.times, t, side='right')
+
+    def _last(self, record_type, end):
+        # Index of the last record of type record_type before record end, or None.
+        found = np.nonzero(self.index['type'][:end] == record_type)[0]
+        return found[-1] if len(found) else None
+
+    def seek(self, ax, t, callback=None):
+        '''Shows the state of the session at time t on the InteractiveCube ax: loads the
+        last keyframe before t, replays the moves that follow it without animation and
+        restores the last view. Returns the number of records up to t.'''
+        end = self.position(t)
+        cube = ax.cube
+        # Without a keyframe, the session starts from the solved cube.
+        key = self._last(STATE, end)
+        if key is not None:
+            cube.set_color_id(self.record(key)[2])
+            first = key + 1
+        else:
+            cube.set_color_id(cube.base_geometry(cube.N)['colors'])
+            first = 0
+        moves = np.nonzero(self.index['type'][first:end] == MOVE)[0]
+        for i in moves + first:
+            face, turns, layer = self.record(i)[2]
+            cube.rotate_face(face, turns, layer=layer)
+        view = self._last(VIEW, end)
+        if view is not None:
+            ax._current_rot = self.record(view)[2]
+        ax._draw_cube()
+        if callback:
+            callback(cube.color_id())
+        return end
+
+    def play(self, ax=None, speed=1., start=0., end=None, steps=3, callback=None, led=None):
+        '''Replays the session from time start to end at the given speed (2 = twice as
+        fast). Drives the InteractiveCube ax if given, calls callback with the color_id of
+        every keyframe and sends the LED frames to the LED controller led.'''
+        end = self.duration if end is None else end
+        first = self.seek(ax, start, callback=callback) if ax else self.position(start)
+        last = self.position(end)
+        clock, t0 = time.time(), start
+        for i in xrange(first, last):
+            t, record_type, value = self.record(i)
+            delay = (t - t0) / speed - (time.time() - clock)
+            if delay > 0:
+                if ax:
+                    plt.pause(delay)
+                else:
+                    time.sleep(delay)
+            if record_type == MOVE and ax:
+                face, turns, layer = value
+                ax.rotate_face(face, turns, layer=layer, steps=steps, execute_call_back=False)
+            elif record_type == VIEW and ax:
+                ax._current_rot = value
+                ax._draw_cube()
+            elif record_type == STATE and callback:
+                callback(value)
+            elif record_type == LED and led:
+                led.send_led_frame(value)
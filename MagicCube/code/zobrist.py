@@ -0,0 +1,29 @@
+'''
+============================================================
+Zobrist hashing of sticker states.
+
+The hash of a state is the XOR of one 64-bit key per (slot, color)
+pair, so a move updates it by XOR-ing out the keys of the stickers it
+takes away and XOR-ing in those it brings. Keys are computed on the
+fly by the splitmix64 mixing function rather than stored, so they cost
+no memory at any cube size and are the same in every process.
+============================================================
+'''
+import numpy as np
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+def keys(slots, values):
+    '''Returns the uint64 keys of the (slot, value) pairs given by the integer arrays
+    slots and values (values < 2^32).'''
+    z = (np.atleast_1d(np.asarray(slots, dtype=np.uint64)) << np.uint64(32)) | np.asarray(values, dtype=np.uint64)
+    z = z + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+def hash_values(slots, values):
+    '''Returns the XOR of the keys of the (slot, value) pairs, as a uint64.'''
+    return np.bitwise_xor.reduce(keys(slots, values).ravel(), dtype=np.uint64) if np.size(slots) else np.uint64(0)